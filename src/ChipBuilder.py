@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
+import hashlib
+import os
+import time
 import numpy as np
 
 import src.library.KLayout.HangingResonator as HangingResonatorCell
 import src.library.KLayout.Main
 import src.library.TextGen as TextGen
+import src.library.HoleMaskCache as HoleMaskCache
+import src.library.AssetCache as AssetCache
 from src.library.Cells import *
 import src.library.ResonatorUtil as Util
 
@@ -32,6 +39,8 @@ class ChipBuilder:
         self.eps_eff = 6.45
         self.port = Port(160, 200, 300, 100, self.width, self.gap, self.ground, self.hole, 90)
         self.hole_mask = "hole_mask_small"
+        self.hole_mask_params = None  # parameters for generated (cached) hole masks
+        self.hole_lattice = None  # (l_spacing, l_size, hd_spacing, hd_size) for hierarchical holes
         self.resonator_list = []  # structure: list of resonator parameters
         self.decorator_list = []  # structure: containing lists of decorators, e.g. air bridges etc
         self.logo_list = {}
@@ -47,7 +56,16 @@ class ChipBuilder:
         self.set_default_airbridge()
         self.default_resonator = HangingResonator(950, 5000, 950, 300, 5e5, 20, 100, 1, 10, 6, 10, 6, 10, 40, 90)
 
+        self.arc_tolerance = None  # maximum chord error of arcs in nm, None for the fixed resolutions of the cells
+        self.pcell_cache_dir = None  # directory for persisting produced pcell geometry, None for no disk cache
+
         self.do_boolean = True
+        self.boolean_mode = 'processor'
+        self.boolean_threads = None
+        self.boolean_tile_size = 1000
+        self.boolean_check = False
+
+        self.incremental = False
 
         # init from template
         if template is not None:
@@ -57,6 +75,27 @@ class ChipBuilder:
         self.lay = None
         self.top = None
         self.dbu = None
+        self._cells = {}  # pcell variants of the current layout, (cell name, frozen params) -> cell index
+
+        # state of the incremental mode, kept between builds
+        self._stage_lay = None  # layout with one cell per stage, before the boolean operations
+        self._stages = {}  # stage name -> (cell index, input hash, bounding box)
+        self._tiles = {}  # (ix, iy) -> boolean result of the tile
+        self._tile_grid = None  # chip size and tile size the tiles belong to
+
+    def __getstate__(self):
+        """
+        Drop the KLayout objects when pickling, e.g. for sending the builder to a worker process
+        @return: state dictionary without layout and top cell
+        """
+        state = self.__dict__.copy()
+        state['lay'] = None
+        state['top'] = None
+        state['_stage_lay'] = None
+        state['_stages'] = {}
+        state['_tiles'] = {}
+        state['_tile_grid'] = None
+        return state
 
     def set_default_finger(self, amount=5, spacing=50, width=10, gap=6, ground=10, hole=40, f_len=20, f_w=16, notch_w=5, notch_d=8, jj_len=12, jj_w=0.9, jj_d=0.5, b_d_f=0.4, b_d_jj=0.2, finger=None) -> ChipBuilder:
         """
@@ -196,6 +235,44 @@ class ChipBuilder:
         @return: ChipBuilder object for chaining
         """
         self.hole_mask = mask
+        self.hole_mask_params = None
+        self.hole_lattice = None
+        return self
+
+    def set_hole_mask_parameters(self, l_spacing=50, l_sigma=2, l_size=2, hd_spacing=10, hd_sigma=2, hd_size=2,
+                                 seed=0) -> ChipBuilder:
+        """
+        Use a generated hole mask matching the chip size instead of a template file. Masks are cached by their
+        parameters (see HoleMaskCache), i.e. they are only generated once
+        @param l_spacing: spacing of the periodic holes
+        @param l_sigma: random offset of the periodic holes
+        @param l_size: size of the periodic holes
+        @param hd_spacing: spacing of the high density holes
+        @param hd_sigma: random offset of the high density holes
+        @param hd_size: size of the high density holes
+        @param seed: seed for the random offsets
+        @return: ChipBuilder object for chaining
+        """
+        self.hole_mask = None
+        self.hole_mask_params = (l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size, seed)
+        self.hole_lattice = None
+        return self
+
+    def set_hole_lattice(self, l_spacing=50, l_size=2, hd_spacing=10, hd_size=2) -> ChipBuilder:
+        """
+        Use hierarchical holes instead of a hole mask file: the periodic and high density holes are written as regular
+        arrays of a single hole cell (without random offsets). Holes inside the keep out layers are removed from the
+        arrays, which keeps the file size and the boolean operations independent of the hole count (see the 'deep'
+        boolean mode)
+        @param l_spacing: spacing of the periodic holes
+        @param l_size: size of the periodic holes
+        @param hd_spacing: spacing of the high density holes
+        @param hd_size: size of the high density holes
+        @return: ChipBuilder object for chaining
+        """
+        self.hole_mask = None
+        self.hole_mask_params = None
+        self.hole_lattice = (l_spacing, l_size, hd_spacing, hd_size)
         return self
 
     def remove_hole_mask(self) -> ChipBuilder:
@@ -204,6 +281,67 @@ class ChipBuilder:
         @return: ChipBuilder object for chaining
         """
         self.hole_mask = None
+        self.hole_mask_params = None
+        self.hole_lattice = None
+        return self
+
+    def set_boolean_mode(self, mode: str, threads=None, tile_size=1000, check=False) -> ChipBuilder:
+        """
+        Set the engine for the boolean layer operations
+        @param mode: 'processor' (sequential ShapeProcessor chain on the flattened chip), 'region' (single fused region
+                     expression), 'deep' (fused region expression in hierarchical mode, i.e. repeated cells like the
+                     holes are only processed once) or 'tiled' (fused expression evaluated tile by tile, memory is
+                     bounded by the tile size)
+        @param threads: amount of threads for the 'deep' and 'tiled' modes, by default chosen by KLayout
+        @param tile_size: edge length of the tiles for the 'tiled' mode
+        @param check: if True, the result is compared to the 'processor' engine (XOR check), also in the incremental
+                      mode. Slow, for regression tests
+        @return: ChipBuilder object for chaining
+        """
+        if mode not in ['processor', 'region', 'deep', 'tiled']:
+            raise ValueError(f"Boolean mode '{mode}' not valid! Use 'processor', 'region', 'deep' or 'tiled'.")
+        self.boolean_mode = mode
+        self.boolean_threads = threads
+        self.boolean_tile_size = tile_size
+        self.boolean_check = check
+        return self
+
+    def set_incremental(self, incremental=True) -> ChipBuilder:
+        """
+        Build chips incrementally. The builder keeps the layout of the previous build, split into stages (TL, hole mask,
+        each resonator, the decorators of each resonator, markers, logos, text and hole lattice). Only stages with
+        changed inputs are rebuilt, and the boolean operations are only repeated for the tiles touched by a rebuilt
+        stage. The boolean operations are evaluated tile by tile as in the 'tiled' mode and the tile results are merged
+        @param incremental: if False, the kept state is dropped and chips are built from scratch again
+        @return: ChipBuilder object for chaining
+        """
+        self.incremental = incremental
+        self._stage_lay = None
+        self._stages = {}
+        self._tiles = {}
+        self._tile_grid = None
+        return self
+
+    def set_arc_tolerance(self, tolerance=None) -> ChipBuilder:
+        """
+        Discretize arcs and tapers of all cells supporting it (resonators, curves, ports, round air bridges) by a
+        maximum chord error instead of a fixed amount of points. The vertex count reduction is reported for each chip
+        @param tolerance: maximum deviation between polygon and ideal contour in nm, None for the fixed resolutions
+        @return: ChipBuilder object for chaining
+        """
+        if tolerance is not None and tolerance <= 0:
+            raise ValueError(f"Arc tolerance has to be positive, got {tolerance}")
+        self.arc_tolerance = tolerance
+        return self
+
+    def set_pcell_cache(self, directory="../../cache/pcells/") -> ChipBuilder:
+        """
+        Persist the produced geometry of all pcell variants on disk, so that repeated builds skip the pcell production.
+        The cache is keyed by the cell parameters only, i.e. it has to be cleared after changes of the library
+        @param directory: cache directory, None for disabling the disk cache
+        @return: ChipBuilder object for chaining
+        """
+        self.pcell_cache_dir = directory
         return self
 
     def set_eps_eff(self, eps_eff: float) -> ChipBuilder:
@@ -380,26 +518,14 @@ class ChipBuilder:
         if resonator is not None:
             self.resonator_list.append(resonator)
         else:
-            # initialize values from default resonator params
-            segment_length = segment_length or self.default_resonator.segment_length
-            x_offset = x_offset or self.default_resonator.x_offset
-            y_offset = y_offset or self.default_resonator.y_offset
-            q_ext = q_ext or self.default_resonator.coupling_length  # q_ext is being saved in coupling length
-            coupling_ground = coupling_ground or self.default_resonator.coupling_ground
-            radius = radius or self.default_resonator.radius
-            shorted = shorted or self.default_resonator.shorted
-            width = width or self.default_resonator.width
-            gap = gap or self.default_resonator.gap
-            ground = ground or self.default_resonator.ground
-            hole = hole or self.default_resonator.hole
+            params = self._resonator_params(segment_length, x_offset, y_offset, q_ext, coupling_ground, radius, shorted,
+                                            width, gap, ground, hole)
 
             length = Util.calc_length(f0, self.eps_eff) / 1000
-            coupling_length = Util.calc_coupling_length(self.width, self.gap, width, gap, coupling_ground, length, q_ext,
-                                                        self.eps_eff)
+            coupling_length = Util.calc_coupling_length(self.width, self.gap, params["width"], params["gap"],
+                                                        params["coupling_ground"], length, params["q_ext"], self.eps_eff)
 
-            self.resonator_list.append(HangingResonator(segment_length, length, x_offset, y_offset, coupling_length,
-                                                        coupling_ground, radius, shorted, self.width, self.gap, width, gap, ground,
-                                                        hole, self.default_resonator.resolution))
+            self.resonator_list.append(self._hanging_resonator(params, length, coupling_length))
         return len(self.resonator_list)-1
 
     def add_decorator(self, position, *args):
@@ -446,12 +572,52 @@ class ChipBuilder:
         if resonator_list is not None:
             self.resonator_list = resonator_list
         else:
+            params = self._resonator_params(segment_length, x_offset, y_offset, q_ext, coupling_ground, radius, shorted,
+                                            width, gap, ground, hole)
+
+            # all lengths and coupling lengths at once, kappa is determined only once for the common geometry
             interval = (f0_end - f0_start) / (amount_resonators - 1)
-            for i in range(amount_resonators):
-                f0 = f0_start + i*interval
-                self.add_resonator(f0, segment_length, x_offset, y_offset, q_ext, coupling_ground, radius, shorted, width, gap, ground, hole)
+            f0 = f0_start + np.arange(amount_resonators)*interval
+            lengths = Util.calc_length(f0, self.eps_eff) / 1000
+            coupling_lengths = Util.calc_coupling_lengths(self.width, self.gap, params["width"], params["gap"],
+                                                          params["coupling_ground"], lengths, params["q_ext"],
+                                                          self.eps_eff)
+
+            for length, coupling_length in zip(lengths.tolist(), coupling_lengths.tolist()):
+                self.resonator_list.append(self._hanging_resonator(params, length, coupling_length))
         return self
 
+    def _resonator_params(self, segment_length, x_offset, y_offset, q_ext, coupling_ground, radius, shorted, width, gap,
+                          ground, hole) -> dict:
+        """
+        Fill unset resonator parameters with the values of the default resonator
+        @return: dictionary of the resonator parameters
+        """
+        return {"segment_length": segment_length or self.default_resonator.segment_length,
+                "x_offset": x_offset or self.default_resonator.x_offset,
+                "y_offset": y_offset or self.default_resonator.y_offset,
+                "q_ext": q_ext or self.default_resonator.coupling_length,  # q_ext is being saved in coupling length
+                "coupling_ground": coupling_ground or self.default_resonator.coupling_ground,
+                "radius": radius or self.default_resonator.radius,
+                "shorted": shorted or self.default_resonator.shorted,
+                "width": width or self.default_resonator.width,
+                "gap": gap or self.default_resonator.gap,
+                "ground": ground or self.default_resonator.ground,
+                "hole": hole or self.default_resonator.hole}
+
+    def _hanging_resonator(self, params: dict, length: float, coupling_length: int) -> HangingResonator:
+        """
+        Create a hanging resonator from filled resonator parameters
+        @param params: resonator parameters, see _resonator_params
+        @param length: length of the resonator
+        @param coupling_length: coupling length of the resonator
+        @return: the resonator
+        """
+        return HangingResonator(params["segment_length"], length, params["x_offset"], params["y_offset"],
+                                coupling_length, params["coupling_ground"], params["radius"], params["shorted"],
+                                self.width, self.gap, params["width"], params["gap"], params["ground"], params["hole"],
+                                self.default_resonator.resolution)
+
     #######################
     ###                 ###
     ### Generation part ###
@@ -463,6 +629,7 @@ class ChipBuilder:
         Build a chip from all the parameters previously set
         @param save_name: name that will be used for the file
         @param file_format: format of the file, by default 'gds'
+        @return: path of the saved chip file
         """
 
         if save_name.lower().endswith(".gds"):
@@ -474,18 +641,54 @@ class ChipBuilder:
 
         print(f"Creating chip {save_name}.{file_format}...")
 
+        if self.incremental:
+            self._build_incremental()
+            self._rotate_design()
+            return self._save_chip(save_name, file_format)
+
         self.lay = pya.Layout()
         self.top = self.lay.create_cell("TOP")
         self.dbu = self.lay.dbu
+        self._cells = {}
 
         self._write_structures()
+        if self.arc_tolerance is not None:
+            self._report_arc_tolerance()
         self._write_markers()
         self._write_logos()
         self._write_text()
+        if self.hole_lattice is not None:
+            self._write_hole_lattice()  # needs the keep out layers of all other structures
         if self.do_boolean:
             self._perform_boolean_operations()
         self._rotate_design()
-        self._save_chip(save_name, file_format)
+        return self._save_chip(save_name, file_format)
+
+    @staticmethod
+    def build_many(specs, workers=None) -> [dict]:
+        """
+        Build several chips in parallel. Each chip is built in its own worker process, which owns its own layout and
+        registered QCL library. Scripts calling this method should be guarded by 'if __name__ == "__main__":'
+        @param specs: list of (ChipBuilder, save_name) or (ChipBuilder, save_name, file_format) tuples
+        @param workers: amount of worker processes, by default the amount of CPU cores
+        @return: list of dictionaries with the name, path and build time (in s) of each chip, in the order of the specs
+        """
+        jobs = []
+        for spec in specs:
+            builder, save_name, *file_format = spec
+            jobs.append((builder, save_name, file_format[0] if file_format else 'gds'))
+
+        print(f"Building {len(jobs)} chips on {workers or os.cpu_count()} workers...")
+
+        start = time.perf_counter()
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(_build_chip_worker, jobs):
+                print(f"Finished chip '{result['name']}' after {result['time']:.1f} s")
+                results.append(result)
+
+        print(f"Built {len(results)} chips in {time.perf_counter() - start:.1f} s")
+        return results
 
     ########################
     ###                  ###
@@ -497,113 +700,218 @@ class ChipBuilder:
         """
         Write the transmission line, resonators and airbridges
         """
-        if self.hole_mask is not None:
+        if self.hole_mask is not None or self.hole_mask_params is not None:
             self._write_holes()
 
         print("Writing structures...")
 
-        ### TL
+        self._write_transmission_line()
+
+        for i, x_prog in enumerate(self._resonator_positions()):
+            self._write_resonator(i, x_prog)
+            self._write_decorators(i, x_prog)
+
+    def _tl_length(self) -> float:
+        """
+        Length of the straight part of the transmission line between the ports
+        @return: length
+        """
+        return self.chip_size[0] - 2*self.port.end_point().x
+
+    def _resonator_positions(self) -> [float]:
+        """
+        x positions of the resonators along the transmission line. The resonators are distributed equally, the safe zone
+        of each resonator is given by the widest resonator
+        @return: list of x positions, one per resonator
+        """
+        tl_len = self._tl_length()
+
+        safe_zone = 0
+
+        for res in self.resonator_list:
+            new_sz = res.segment_length + 2*(res.radius + res.ground + res.hole + res.gap + res.width/2)
+            safe_zone = new_sz if new_sz > safe_zone else safe_zone
+
+        residual = tl_len - safe_zone*(len(self.resonator_list)/2+0.5)
+
+        safe_zone += residual / (len(self.resonator_list)/2+0.5)
 
+        return [-tl_len/2 + (i+1)*safe_zone/2 for i in range(len(self.resonator_list))]
+
+    def _write_transmission_line(self):
+        """
+        Write the transmission line with both ports
+        """
         x_prog = -self.chip_size[0]/2
-        port_cell = self.lay.create_cell(self.port.cell_name(), lib_name, self.port.as_list())
+        port_cell = self._create_cell(self.port)
         trans = pya.DCplxTrans.new(1, 0, False, x_prog, 0)
         self.top.insert(pya.DCellInstArray(port_cell.cell_index(), trans))
 
         port_len = self.port.end_point().x
         x_prog += port_len
 
-        tl_len = self.chip_size[0] - 2*port_len
-
-        straight = Straight(tl_len, self.width, self.gap, self.ground, self.hole)
-        straight_cell = self.lay.create_cell(straight.cell_name(), lib_name, straight.as_list())
+        straight = Straight(self._tl_length(), self.width, self.gap, self.ground, self.hole)
+        straight_cell = self._create_cell(straight)
         trans = pya.DCplxTrans.new(1, 0, False, x_prog, 0)
         self.top.insert(pya.DCellInstArray(straight_cell.cell_index(), trans))
         x_prog += straight.end_point().x
 
-        port_cell = self.lay.create_cell(self.port.cell_name(), lib_name, self.port.as_list())
+        port_cell = self._create_cell(self.port)
         trans = pya.DCplxTrans.new(1, 180, False, x_prog+port_len, 0)
         self.top.insert(pya.DCellInstArray(port_cell.cell_index(), trans))
 
-        ### Resonators
-
-        safe_zone = 0
-
-        for res in self.resonator_list:
-            new_sz = res.segment_length + 2*(res.radius + res.ground + res.hole + res.gap + res.width/2)
-            safe_zone = new_sz if new_sz > safe_zone else safe_zone
-
-        residual = tl_len - safe_zone*(len(self.resonator_list)/2+0.5)
-
-        safe_zone += residual / (len(self.resonator_list)/2+0.5)
+    def _write_resonator(self, i: int, x_prog: float):
+        """
+        Write a single resonator. Resonators alternate between the upper and lower side of the TL
+        @param i: index of the resonator
+        @param x_prog: x position of the resonator
+        """
+        res: Resonator
+        res = self.resonator_list[i]
+        up = i % 2 == 0
 
-        up = True
+        if isinstance(res, Resonator):
+            res_cell = self._create_cell(res)
+        else:
+            raise ValueError(f"Unknown resonator type {type(res)}")
 
-        x_prog = -tl_len/2
+        trans = pya.DCplxTrans.new(1, 0, not up, x_prog, 0)
+        self.top.insert(pya.DCellInstArray(res_cell.cell_index(), trans))
 
-        for i in range(len(self.resonator_list)):
-            res: Resonator
-            res = self.resonator_list[i]
+    def _write_decorators(self, i: int, x_prog: float):
+        """
+        Write the decorators of a single resonator (air bridges, fingers, etc.) and its TL air bridge
+        @param i: index of the resonator
+        @param x_prog: x position of the resonator
+        """
+        res: Resonator
+        res = self.resonator_list[i]
+        up = i % 2 == 0
 
-            decorators: (Decorator,)  # air bridges, fingers, etc in list
-            try:
-                decorators = self.decorator_list[i]
-                if decorators is None:
-                    decorators = ()
-            except IndexError:
+        decorators: (Decorator,)  # air bridges, fingers, etc in list
+        try:
+            decorators = self.decorator_list[i]
+            if decorators is None:
                 decorators = ()
+        except IndexError:
+            decorators = ()
+
+        # TL air bridges
+        if self.tl_airbridges is True:
+            ab_pos = x_prog + res.radius + res.segment_length/2 + 40
+            ab_cell = self._create_cell(self.default_airbridge)
+            trans = pya.DCplxTrans.new(1, 0, False, ab_pos, 0)
+            self.top.insert(pya.DCellInstArray(ab_cell.cell_index(), trans))
+
+        # Resonator decorators
+        for decorator in decorators:
+            if isinstance(decorator, Airbridge):
+                ab_cell = self._create_cell(decorator)
+                len_start = res.coupling_length + np.pi*res.radius/2 + res.y_offset/2
+                amount_bridges = int(np.floor((res.length-len_start)/decorator.spacing))
+
+                z = np.linspace(len_start/res.length, (len_start+decorator.spacing*amount_bridges)/res.length,
+                                amount_bridges)
+                z = z[res.length*(1-z) >= 200]  # skip positions too close to end of resonator
+                coords = HangingResonatorCell.get_coords(z, pya.DPoint(0, 0), 0, res)
+
+                for x, y, rot in zip(*(c.tolist() for c in coords)):
+                    trans = pya.DCplxTrans.new(1, 0, not up, 0, 0)*pya.DCplxTrans.new(1, rot, 0, x+x_prog, y)
+                    self.top.insert(pya.DCellInstArray(ab_cell.cell_index(), trans))
+
+            elif isinstance(decorator, Finger):
+                finger_cell = self._create_cell(decorator)
+                len_start = res.coupling_length + np.pi*res.radius/2 + res.y_offset/2
+
+                z = np.linspace(len_start/res.length, (len_start+decorator.spacing*decorator.amount)/res.length,
+                                decorator.amount)
+                z = z[res.length*(1-z) >= 200]  # skip positions too close to end of resonator
+                coords = HangingResonatorCell.get_coords(z, pya.DPoint(0, 0), 0, res)
+
+                for x, y, rot in zip(*(c.tolist() for c in coords)):
+                    trans = pya.DCplxTrans.new(1, 0, not up, 0, 0)*pya.DCplxTrans.new(1, rot, 0, x+x_prog, y)
+                    self.top.insert(pya.DCellInstArray(finger_cell.cell_index(), trans))
+
+            else:
+                print(f"Skipping unknown decorator type '{type(decorator)}'")
 
-            x_prog += safe_zone/2
+    def _create_cell(self, cell_object: CellObject) -> pya.Cell:
+        """
+        Create a library cell, reusing the variant of the current layout if the parameters are identical
+        @param cell_object: cell object, e.g. a resonator or an air bridge
+        @return: the cell
+        """
+        params = cell_object.as_list()
+        if self.arc_tolerance is not None and "chord_error" in _pcell_parameters(cell_object.cell_name()):
+            params["chord_error"] = self.arc_tolerance*1e-3/self.dbu
+        key = (cell_object.cell_name(), _freeze(params))
 
-            if isinstance(res, Resonator):
-                res_cell = self.lay.create_cell(res.cell_name(), lib_name, res.as_list())
+        if key not in self._cells:
+            if self.pcell_cache_dir is None:
+                cell = self.lay.create_cell(cell_object.cell_name(), lib_name, params)
             else:
-                raise ValueError(f"Unknown resonator type {type(res)}")
-
-            # TL air bridges
-            if self.tl_airbridges is True:
-                ab_pos = x_prog + res.radius + res.segment_length/2 + 40
-                ab_cell = self.lay.create_cell(self.default_airbridge.cell_name(), lib_name, self.default_airbridge.as_list())
-                trans = pya.DCplxTrans.new(1, 0, False, ab_pos, 0)
-                self.top.insert(pya.DCellInstArray(ab_cell.cell_index(), trans))
-
-            # Resonator
-            trans = pya.DCplxTrans.new(1, 0, not up, x_prog, 0)
-            self.top.insert(pya.DCellInstArray(res_cell.cell_index(), trans))
-
-            # Resonator decorators
-            for decorator in decorators:
-                if isinstance(decorator, Airbridge):
-                    ab_cell = self.lay.create_cell(decorator.cell_name(), lib_name, decorator.as_list())
-                    len_start = res.coupling_length + np.pi*res.radius/2 + res.y_offset/2
-                    amount_bridges = int(np.floor((res.length-len_start)/decorator.spacing))
-
-                    for z in np.linspace(len_start/res.length,
-                                         (len_start+decorator.spacing*amount_bridges)/res.length,
-                                         amount_bridges):
-                        if res.length*(1-z) < 200:  # too close to end of resonator
-                            continue
-                        x, y, rot = HangingResonatorCell.get_coord(z, pya.DPoint(0, 0), 0, res)
-                        trans = pya.DCplxTrans.new(1, 0, not up, 0, 0)*pya.DCplxTrans.new(1, rot, 0, x+x_prog, y)
-                        self.top.insert(pya.DCellInstArray(ab_cell.cell_index(), trans))
-
-                elif isinstance(decorator, Finger):
-                    finger_cell = self.lay.create_cell(decorator.cell_name(), lib_name, decorator.as_list())
-                    len_start = res.coupling_length + np.pi*res.radius/2 + res.y_offset/2
-
-                    for z in np.linspace(len_start/res.length, (len_start+decorator.spacing*
-                                                                decorator.amount)/res.length, decorator.amount):
-
-                        if res.length*(1-z) < 200:  # too close to end of resonator
-                            continue
-
-                        x, y, rot = HangingResonatorCell.get_coord(z, pya.DPoint(0, 0), 0, res)
-                        trans = pya.DCplxTrans.new(1, 0, not up, 0, 0)*pya.DCplxTrans.new(1, rot, 0, x+x_prog, y)
-                        self.top.insert(pya.DCellInstArray(finger_cell.cell_index(), trans))
+                cell = self._create_cached_cell(key, params)
+            self._cells[key] = cell.cell_index()
+
+        return self.lay.cell(self._cells[key])
+
+    def _report_arc_tolerance(self):
+        """
+        Print the vertex count of all placed cells with tolerance-based arcs, compared to the fixed resolution variants.
+        Tight tolerances may need more vertices than the fixed resolutions
+        """
+        instances = {}
+        for inst in self.top.each_inst():
+            instances[inst.cell_index] = instances.get(inst.cell_index, 0) + inst.cell_inst.size()
+
+        reference = pya.Layout()
+        reference.dbu = self.dbu
+        adaptive = 0
+        fixed = 0
+        for (cell_name, frozen_params), cell_index in self._cells.items():
+            params = dict(frozen_params)
+            if "chord_error" not in params or cell_index not in instances:
+                continue
+            params["chord_error"] = 0
+            adaptive += instances[cell_index]*_vertex_count(self.lay.cell(cell_index))
+            fixed += instances[cell_index]*_vertex_count(reference.create_cell(cell_name, lib_name, params))
+
+        if fixed > 0:
+            change = 100*(adaptive/fixed - 1)
+            print(f"Arc tolerance {self.arc_tolerance} nm: {adaptive} vertices instead of {fixed} "
+                  f"({abs(change):.1f} % {'more' if change > 0 else 'less'})")
+
+    def _create_cached_cell(self, key, params) -> pya.Cell:
+        """
+        Create a static copy of a library cell from the disk cache. On a cache miss, the pcell is produced and its
+        geometry is stored in the cache
+        @param key: cell name and frozen parameters
+        @param params: parameter dictionary of the pcell
+        @return: the cell
+        """
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = Path(self.pcell_cache_dir) / f"{name}.gds"
+
+        aux = pya.Layout()
+        aux.dbu = self.dbu
+        if path.exists():
+            aux.read(str(path))
+            source = aux.top_cell()
+        else:
+            source = aux.create_cell(key[0], lib_name, params)
 
-                else:
-                    print(f"Skipping unknown decorator type '{type(decorator)}'")
+            # write without library context, so that the cell is read as a static cell
+            options = pya.SaveLayoutOptions()
+            options.format = "GDS2"
+            options.write_context_info = False
+            Path(self.pcell_cache_dir).mkdir(parents=True, exist_ok=True)
+            tmp_path = Path(self.pcell_cache_dir) / f"{name}.{os.getpid()}.tmp"
+            source.write(str(tmp_path), options)
+            os.replace(tmp_path, path)
 
-            up = not up
+        cell = self.lay.create_cell(f"{key[0]}_{name[:8]}")
+        cell.copy_tree(source)
+        return cell
 
     def _write_holes(self):
         """
@@ -611,13 +919,93 @@ class ChipBuilder:
         """
         print("Writing holes...")
 
-        self.lay.read(f"../../templates/{self.hole_mask}.gds")
+        if self.hole_mask_params is not None:
+            path = HoleMaskCache.get_hole_mask(*self.chip_size, *self.hole_mask_params)
+        else:
+            path = AssetCache.template_path(self.hole_mask)
 
-        cell = self.lay.top_cells()[1].cell_index()
+        cell = AssetCache.copy_cell(self.lay, path).cell_index()
         trans = pya.DCplxTrans.new(1, 0, False, 0, 0)
         self.top.insert(pya.DCellInstArray(cell, trans))
         self.top.flatten(1)
 
+    def _write_hole_lattice(self):
+        """
+        Write the periodic and high density holes as regular arrays of a single hole cell. Each lattice row is split into
+        the intervals where holes are allowed, holes partly covered by the keep out layers are clipped by the boolean
+        operations
+        """
+        print("Writing hole lattice...")
+
+        l_spacing, l_size, hd_spacing, hd_size = self.hole_lattice
+        top = self.lay.cell("TOP")  # in the incremental mode, self.top is the cell of the hole lattice stage
+
+        def region(layers):
+            result = pya.Region()
+            for layer in layers:
+                result += pya.Region(top.begin_shapes_rec(self.lay.layer(pya.LayerInfo(layer, 0))))
+            return result
+
+        chip = pya.Region(pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                                  self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
+
+        holes = self.lay.create_cell("HOLES")
+
+        # periodic holes everywhere except for the spacing, hd hole mask, text, logos and airbridge pads
+        allowed = chip - region([2, 10, 11, 14, 15, 110])
+        self._write_hole_rows(holes, 12, l_spacing, l_size, allowed)
+
+        # high density holes only inside the hd hole mask
+        allowed = chip & (region([11]) - region([10, 15, 110]))
+        self._write_hole_rows(holes, 13, hd_spacing, hd_size, allowed)
+
+        self.top.insert(pya.CellInstArray(holes.cell_index(), pya.Trans()))
+
+    def _write_hole_rows(self, holes, layer, spacing, size, allowed):
+        """
+        Write a hole lattice row by row as one dimensional arrays of a single hole cell
+        @param holes: cell receiving the hole arrays
+        @param layer: layer of the holes
+        @param spacing: spacing of the holes
+        @param size: size of the holes
+        @param allowed: region in which holes are allowed
+        """
+        hole = self.lay.create_cell(f"HOLE_{layer}")
+        hole.shapes(self.lay.layer(pya.LayerInfo(layer, 0))).insert(pya.Box(-size/2/self.dbu, -size/2/self.dbu,
+                                                                            size/2/self.dbu, size/2/self.dbu))
+        nx = int(self.chip_size[0] / spacing)
+        ny = int(self.chip_size[1] / spacing)
+
+        # positions identical to the Hole pcell, in database units
+        pitch = int(round(spacing/self.dbu))
+        half = size/2/self.dbu
+        x_first = (spacing/2 - self.chip_size[0]/2)/self.dbu
+
+        amount = 0
+        for j in range(ny):
+            y = int(round(((j + 1/2)*spacing - self.chip_size[1]/2)/self.dbu))
+            stripe = allowed & pya.Region(pya.Box(x_first - half, y - half, x_first + (nx-1)*pitch + half, y + half))
+
+            # merge the x extents of all free pieces, so that no hole is written twice
+            intervals = []
+            for left, right in sorted((p.bbox().left, p.bbox().right) for p in stripe.each()):
+                if intervals and left <= intervals[-1][1]:
+                    intervals[-1][1] = max(intervals[-1][1], right)
+                else:
+                    intervals.append([left, right])
+
+            for left, right in intervals:
+                i_start = max(0, int(np.floor((left - half - x_first)/pitch)) + 1)
+                i_end = min(nx - 1, int(np.ceil((right + half - x_first)/pitch)) - 1)
+                if i_end < i_start:
+                    continue
+                x = int(round(x_first + i_start*pitch))
+                holes.insert(pya.CellInstArray(hole.cell_index(), pya.Trans(pya.Vector(x, y)),
+                                               pya.Vector(pitch, 0), pya.Vector(0, 0), i_end - i_start + 1, 1))
+                amount += i_end - i_start + 1
+
+        print(f"{amount} holes on layer {layer}")
+
     def _write_markers(self):
         """
         Write the alignment markers
@@ -627,6 +1015,8 @@ class ChipBuilder:
         x_sign = -1
         y_sign = 1
 
+        cells = {}  # (marker name, layer) -> cell index of the marker on that layer
+
         for position, data in self.marker_list.items():
             if position == 'ul':
                 x_sign = -1
@@ -651,16 +1041,17 @@ class ChipBuilder:
 
             for layer in layers:
 
-                self.lay.read(f"../../templates/{marker_name}.gds")
-                cell = self.lay.top_cells()[1].cell_index()
-
-                self.lay.top_cells()[1].swap(self.lay.layer(pya.LayerInfo(0, 0)),
-                                             self.lay.layer(pya.LayerInfo(layer, 0)))
+                if (marker_name, layer) not in cells:
+                    cell = AssetCache.copy_cell(self.lay, AssetCache.template_path(marker_name))
+                    cell.swap(self.lay.layer(pya.LayerInfo(0, 0)), self.lay.layer(pya.LayerInfo(layer, 0)))
+                    cells[(marker_name, layer)] = cell.cell_index()
 
                 trans = pya.DCplxTrans.new(1, marker_rotation, False, x_sign*(self.chip_size[0]/2 - marker_spacing),
                                            y_sign*(self.chip_size[1]/2 - marker_spacing))
-                self.top.insert(pya.DCellInstArray(cell, trans))
-                self.top.flatten(1)
+                self.top.insert(pya.DCellInstArray(cells[(marker_name, layer)], trans))
+
+        if cells:
+            self.top.flatten(1)
 
     def _write_logos(self):
         """
@@ -697,8 +1088,7 @@ class ChipBuilder:
                 cell = TextGen.write_text(self.lay, logo_name.split(":", 1)[1])
                 pass
             else:
-                self.lay.read(f"../../templates/{logo_name}.gds")
-                cell = self.lay.top_cells()[1]
+                cell = AssetCache.copy_cell(self.lay, AssetCache.template_path(logo_name))
 
             bbox = cell.bbox()
             trans = pya.DCplxTrans.new(size_multiplier, 0, False,
@@ -714,123 +1104,414 @@ class ChipBuilder:
         """
         print("Writing text...")
 
-        if "$FREQUENCIES$" in self.text:
-            frequencies = []
-            for res in self.resonator_list:
-                frequencies.append(Util.calc_f0(res.length*1000, self.eps_eff))
+        lines = self._chip_text().splitlines()
+
+        y_shift = (-self.chip_size[1]/2 + len(lines)*150.) / self.dbu
 
-            f_text = ""
+        for text in TextGen.get_atlas().write_many(self.lay, lines):
+            TextGen.place_cell_center(self.lay, self.top, text, 3, 0, y_shift*self.dbu)
+            y_shift -= 150 / self.dbu
 
-            for i in range(len(frequencies)):
-                if len(frequencies) > 16 and i == np.floor(len(frequencies) / 2):
-                    f_text += "\n"
-                f_text += "{:.2f}".format(frequencies[i])
-                if i < len(frequencies) - 1:
-                    f_text += ", "
+    def _chip_text(self) -> str:
+        """
+        The chip text with the resonator frequencies inserted for the placeholder $FREQUENCIES$
+        @return: text
+        """
+        if "$FREQUENCIES$" not in self.text:
+            return self.text
 
-            self.text = self.text.replace("$FREQUENCIES$", f_text)
+        frequencies = []
+        for res in self.resonator_list:
+            frequencies.append(Util.calc_f0(res.length*1000, self.eps_eff))
 
-        lines = self.text.splitlines()
+        f_text = ""
 
-        y_shift = (-self.chip_size[1]/2 + len(lines)*150.) / self.dbu
+        for i in range(len(frequencies)):
+            if len(frequencies) > 16 and i == np.floor(len(frequencies) / 2):
+                f_text += "\n"
+            f_text += "{:.2f}".format(frequencies[i])
+            if i < len(frequencies) - 1:
+                f_text += ", "
 
-        for line in lines:
-            text = TextGen.write_text(self.lay, line)
-            TextGen.place_cell_center(self.lay, self.top, text, 3, 0, y_shift*self.dbu)
-            y_shift -= 150 / self.dbu
+        return self.text.replace("$FREQUENCIES$", f_text)
 
     def _perform_boolean_operations(self):
         """
         Subroutine for performing the boolean layer operations. This has to be done after adding all of the pcells
         """
 
-        print("performing boolean operations...")
+        print(f"performing boolean operations ({self.boolean_mode})...")
+
+        reference = None
+        if self.boolean_check and self.boolean_mode != 'processor':
+            reference = self.lay.dup()
+            self._boolean_processor(reference, reference.cell("TOP"))
+
+        if self.boolean_mode == 'processor':
+            self._boolean_processor(self.lay, self.top)
+        elif self.boolean_mode == 'tiled':
+            self._boolean_tiled()
+        else:
+            self._boolean_region(deep=self.boolean_mode == 'deep')
+
+        if reference is not None:
+            self._check_boolean_result(reference)
+
+    def _boolean_processor(self, lay, top):
+        """
+        Boolean operations as a sequential chain of ShapeProcessor operations on the flattened chip
+        @param lay: layout to operate on
+        @param top: top cell of the layout
+        """
 
         # define layers for convenience
-        l0 = self.lay.layer(pya.LayerInfo(0, 0))  # logos and text
-        l1 = self.lay.layer(pya.LayerInfo(1, 0))  # main structure
-        l2 = self.lay.layer(pya.LayerInfo(2, 0))  # text mask
-        l3 = self.lay.layer(pya.LayerInfo(3, 0))  # chip border for holes
-        l5 = self.lay.layer(pya.LayerInfo(5, 0))  # jj electrodes
-        l6 = self.lay.layer(pya.LayerInfo(6, 0))  # bandages
-        l10 = self.lay.layer(pya.LayerInfo(10, 0))  # spacing
-        l11 = self.lay.layer(pya.LayerInfo(11, 0))  # high density hole mask
-        l12 = self.lay.layer(pya.LayerInfo(12, 0))  # periodic holes
-        l13 = self.lay.layer(pya.LayerInfo(13, 0))  # high density holes
-        l14 = self.lay.layer(pya.LayerInfo(14, 0))  # logo background for removing periodic holes
-        l15 = self.lay.layer(pya.LayerInfo(15, 0))  # airbridge contact pads
-        l16 = self.lay.layer(pya.LayerInfo(16, 0))  # airbridge bridges (negative resist)
-        l110 = self.lay.layer(pya.LayerInfo(110, 0))    # finger (remove resonator gap)
+        l0 = lay.layer(pya.LayerInfo(0, 0))  # logos and text
+        l1 = lay.layer(pya.LayerInfo(1, 0))  # main structure
+        l2 = lay.layer(pya.LayerInfo(2, 0))  # text mask
+        l3 = lay.layer(pya.LayerInfo(3, 0))  # chip border for holes
+        l5 = lay.layer(pya.LayerInfo(5, 0))  # jj electrodes
+        l6 = lay.layer(pya.LayerInfo(6, 0))  # bandages
+        l10 = lay.layer(pya.LayerInfo(10, 0))  # spacing
+        l11 = lay.layer(pya.LayerInfo(11, 0))  # high density hole mask
+        l12 = lay.layer(pya.LayerInfo(12, 0))  # periodic holes
+        l13 = lay.layer(pya.LayerInfo(13, 0))  # high density holes
+        l14 = lay.layer(pya.LayerInfo(14, 0))  # logo background for removing periodic holes
+        l15 = lay.layer(pya.LayerInfo(15, 0))  # airbridge contact pads
+        l16 = lay.layer(pya.LayerInfo(16, 0))  # airbridge bridges (negative resist)
+        l110 = lay.layer(pya.LayerInfo(110, 0))    # finger (remove resonator gap)
 
         # flatten, otherwise boolean operations won't work
-        self.top.flatten(1)
+        top.flatten(1)
 
         # prepare a shape processor
         processor = pya.ShapeProcessor()
 
         # remove resonator gap for finger structures
-        processor.boolean(self.lay, self.top, l110, self.lay, self.top, l1, self.top.shapes(l1),
+        processor.boolean(lay, top, l110, lay, top, l1, top.shapes(l1),
                           pya.EdgeProcessor.ModeBNotA, True, True, True)
         # place fingers into layer 10
-        processor.boolean(self.lay, self.top, l110, self.lay, self.top, l10, self.top.shapes(l10),
+        processor.boolean(lay, top, l110, lay, top, l10, top.shapes(l10),
                           pya.EdgeProcessor.ModeOr, True, True, True)
 
         # make sure ground is also at high density holes
-        processor.boolean(self.lay, self.top, l11, self.lay, self.top, l10, self.top.shapes(l11),
+        processor.boolean(lay, top, l11, lay, top, l10, top.shapes(l11),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
 
         # layer for chip boundaries
-        self.top.shapes(l3).insert(pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
-                                           self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
+        top.shapes(l3).insert(pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                                      self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
 
         # periodic holes in chip boundaries
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l3, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l3, top.shapes(l12),
                           pya.EdgeProcessor.ModeAnd, True, True, True)
 
         # remove periodic holes from hd hole mask
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l11, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l11, top.shapes(l12),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
         # remove periodic holes from ground
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l10, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l10, top.shapes(l12),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
         # remove periodic holes from logo background
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l14, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l14, top.shapes(l12),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
         # remove periodic holes from text
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l2, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l2, top.shapes(l12),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
         # remove periodic holes from airbridge pads
-        processor.boolean(self.lay, self.top, l12, self.lay, self.top, l15, self.top.shapes(l12),
+        processor.boolean(lay, top, l12, lay, top, l15, top.shapes(l12),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
-        processor.boolean(self.lay, self.top, l11, self.lay, self.top, l15, self.top.shapes(l11),
+        processor.boolean(lay, top, l11, lay, top, l15, top.shapes(l11),
                           pya.EdgeProcessor.ModeANotB, True, True, True)
 
         # hd hole mask in chip boundaries
-        processor.boolean(self.lay, self.top, l13, self.lay, self.top, l11, self.top.shapes(l13),
+        processor.boolean(lay, top, l13, lay, top, l11, top.shapes(l13),
                           pya.EdgeProcessor.ModeAnd, True, True, True)
 
         # place everything into a single layer (0, 12, 13 into 1)
-        target_layer = self.top.shapes(l1)
+        target_layer = top.shapes(l1)
 
-        target_layer.insert(self.top.shapes(l13))
-        target_layer.insert(self.top.shapes(l12))
-        target_layer.insert(self.top.shapes(l0))
+        target_layer.insert(top.shapes(l13))
+        target_layer.insert(top.shapes(l12))
+        target_layer.insert(top.shapes(l0))
 
         # remove auxiliary layers
-        self.lay.clear_layer(l10)
-        self.lay.clear_layer(l11)
-        self.lay.clear_layer(l14)
-        self.lay.clear_layer(l2)
-        self.lay.clear_layer(l110)
+        lay.clear_layer(l10)
+        lay.clear_layer(l11)
+        lay.clear_layer(l14)
+        lay.clear_layer(l2)
+        lay.clear_layer(l110)
 
-        self.lay.clear_layer(l0)
-        self.lay.clear_layer(l12)
-        self.lay.clear_layer(l13)
+        lay.clear_layer(l0)
+        lay.clear_layer(l12)
+        lay.clear_layer(l13)
 
         # merge shapes
-        processor.boolean(self.lay, self.top, l1, self.lay, self.top, l1, self.top.shapes(l1),
+        processor.boolean(lay, top, l1, lay, top, l1, top.shapes(l1),
                           pya.EdgeProcessor.ModeAnd, True, True, True)
 
+    def _boolean_region(self, deep=False):
+        """
+        Boolean operations as a single fused expression over regions. In deep mode, the regions are kept hierarchical,
+        so the hole subtraction scales with the amount of distinct hole cells instead of the amount of hole instances
+        @param deep: if True, use hierarchical (deep) regions
+        """
+        dss = None
+        if deep:
+            dss = pya.DeepShapeStore()
+            if self.boolean_threads is not None:
+                dss.threads = self.boolean_threads
+
+        # layer for chip boundaries
+        self.top.shapes(self.lay.layer(pya.LayerInfo(3, 0))).insert(
+            pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                    self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
+
+        def region(layer):
+            layer_index = self.lay.layer(pya.LayerInfo(layer, 0))
+            if dss is not None:
+                return pya.Region(self.top.begin_shapes_rec(layer_index), dss)
+            return pya.Region(self.top.begin_shapes_rec(layer_index))
+
+        self._finish_boolean(_fused_boolean(region))
+
+    def _boolean_tiled(self):
+        """
+        Boolean operations with KLayout's TilingProcessor. The chip is partitioned into tiles and the fused expression is
+        evaluated per tile on a thread pool, so the memory consumption is bounded by the tile size, not the chip area.
+        The tile results are collected in a region and merged, i.e. polygons are stitched at the tile borders
+        """
+        # layer for chip boundaries
+        self.top.shapes(self.lay.layer(pya.LayerInfo(3, 0))).insert(
+            pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                    self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
+
+        result = pya.Region()
+
+        processor = pya.TilingProcessor()
+        for layer in [0, 1, 2, 3, 10, 11, 12, 13, 14, 15, 110]:
+            processor.input(f"l{layer}", self.lay, self.top.cell_index(), self.lay.layer(pya.LayerInfo(layer, 0)))
+        processor.output("result", result)
+        processor.tile_size(self.boolean_tile_size, self.boolean_tile_size)
+        if self.boolean_threads is not None:
+            processor.threads = self.boolean_threads
+        processor.queue(_TILED_BOOLEAN)
+        processor.execute("Boolean operations")
+
+        self._finish_boolean(result.merged())
+
+    def _finish_boolean(self, result):
+        """
+        Replace the main layer by the boolean result, remove the auxiliary layers and flatten the remaining ones
+        @param result: region containing the final main layer
+        """
+        for layer in [0, 1, 2, 10, 11, 12, 13, 14, 110]:
+            self.lay.clear_layer(self.lay.layer(pya.LayerInfo(layer, 0)))
+
+        self.top.flatten(1)
+        self.top.shapes(self.lay.layer(pya.LayerInfo(1, 0))).insert(result)
+
+    def _check_boolean_result(self, reference):
+        """
+        Regression check: compares every layer to a reference layout created by the 'processor' engine (XOR check).
+        The engines round intersection points of non-Manhattan edges at different steps, so the results may differ by
+        slivers of boolean_check_tolerance database units. Only differences which survive shrinking by this tolerance
+        are reported
+        @param reference: reference layout
+        """
+        reference_top = reference.cell("TOP")
+        infos = {str(info): info for info in [self.lay.get_info(li) for li in self.lay.layer_indexes()] +
+                 [reference.get_info(li) for li in reference.layer_indexes()]}
+
+        for name, info in infos.items():
+            layer_index = self.lay.find_layer(info)
+            reference_index = reference.find_layer(info)
+            current = pya.Region() if layer_index is None else pya.Region(self.top.begin_shapes_rec(layer_index))
+            expected = pya.Region() if reference_index is None else \
+                pya.Region(reference_top.begin_shapes_rec(reference_index))
+            difference = (current ^ expected).sized(-boolean_check_tolerance)
+            if not difference.is_empty():
+                raise ValueError(f"Boolean regression check failed: layer {name} differs in {difference.count()} "
+                                 f"polygons!")
+
+        print(f"Boolean regression check passed (XOR clean up to {boolean_check_tolerance} dbu)")
+
+    def _build_incremental(self):
+        """
+        Incremental build: rebuild the stages with changed inputs in the kept stage layout, repeat the boolean operations
+        for the affected tiles and compose the output layout
+        """
+        start = time.perf_counter()
+
+        if self._stage_lay is None:
+            self._stage_lay = pya.Layout()
+            self._stage_lay.create_cell("TOP")
+            self._stages = {}
+            self._tiles = {}
+            self._cells = {}
+
+        self.lay = self._stage_lay
+        self.top = self.lay.cell("TOP")
+        self.dbu = self.lay.dbu
+
+        stages = self._chip_stages()
+        dirty_boxes = []
+
+        for name in [name for name in self._stages if name not in stages]:
+            cell_index, _, bbox = self._stages.pop(name)
+            print(f"Removing stage {name}...")
+            self._clear_stage(cell_index)
+            self.lay.prune_cell(cell_index, -1)
+            dirty_boxes.append(bbox)
+
+        rebuilt = 0
+        for name, (key, writer, locality) in stages.items():
+            if name in self._stages and self._stages[name][1] == key:
+                continue
+
+            if name in self._stages:
+                cell_index, old_key, bbox = self._stages[name]
+                self._clear_stage(cell_index)
+            else:
+                cell_index, old_key, bbox = self.lay.create_cell(f"STAGE_{name}").cell_index(), None, pya.Box()
+                self.lay.cell("TOP").insert(pya.CellInstArray(cell_index, pya.Trans()))
+
+            print(f"Rebuilding stage {name}...")
+            self.top = self.lay.cell(cell_index)
+            writer()
+            self.top = self.lay.cell("TOP")
+            rebuilt += 1
+
+            new_bbox = self.lay.cell(cell_index).bbox()
+            self._stages[name] = (cell_index, key, new_bbox)
+
+            if locality is not None and old_key is not None and old_key[0] == key[0]:
+                # only the inputs from other stages changed, so the stage changed only close to their changes
+                dirty_boxes = dirty_boxes + [box.enlarged(locality, locality) for box in dirty_boxes]
+            else:
+                dirty_boxes += [bbox, new_bbox]
+
+        print(f"Rebuilt {rebuilt} of {len(stages)} stages")
+
+        if self.do_boolean:
+            self._boolean_incremental([box for box in dirty_boxes if not box.empty()])
+
+        self._compose_incremental()
+        print(f"Incremental build took {time.perf_counter() - start:.1f} s")
+
+    def _chip_stages(self) -> dict:
+        """
+        Stages of the incremental build in the order of writing. Each stage is described by the hash of its inputs, its
+        writer and, for stages depending on other stages, the distance up to which a change of another stage can change
+        the stage (None for stages only depending on their own inputs)
+        @return: dictionary of stage name -> (input hash, writer, locality)
+        """
+        stages = {}
+        common = (self.chip_size, self.arc_tolerance)
+
+        if self.hole_mask is not None or self.hole_mask_params is not None:
+            stages["holes"] = (_stage_hash(common, self.hole_mask, self.hole_mask_params), self._write_holes, None)
+
+        stages["tl"] = (_stage_hash(common, self.port.as_list(), self.width, self.gap, self.ground, self.hole),
+                        self._write_transmission_line, None)
+
+        for i, x_prog in enumerate(self._resonator_positions()):
+            res = self.resonator_list[i]
+            decorators = self.decorator_list[i] if i < len(self.decorator_list) else None
+            stages[f"resonator_{i}"] = (_stage_hash(common, x_prog, i % 2, res.cell_name(), res.as_list()),
+                                        partial(self._write_resonator, i, x_prog), None)
+            stages[f"decorators_{i}"] = (_stage_hash(common, x_prog, i % 2, res.as_list(), self.tl_airbridges,
+                                                     self.default_airbridge.as_list(),
+                                                     [(type(d).__name__, d.as_list()) for d in decorators or ()]),
+                                         partial(self._write_decorators, i, x_prog), None)
+
+        stages["markers"] = (_stage_hash(common, self.global_rotation, self.marker_list), self._write_markers, None)
+        stages["logos"] = (_stage_hash(common, self.logo_list), self._write_logos, None)
+
+        stages["text"] = (_stage_hash(common, self._chip_text()), self._write_text, None)
+
+        if self.hole_lattice is not None:
+            # the hole lattice depends on the keep out layers of all other stages
+            own = _stage_hash(common, self.hole_lattice)
+            others = _stage_hash([key for key, _, _ in stages.values()])
+            locality = int(np.ceil(max(self.hole_lattice[0], self.hole_lattice[2])/self.dbu))
+            stages["hole_lattice"] = ((own, others), self._write_hole_lattice, locality)
+
+        return stages
+
+    def _clear_stage(self, cell_index: int):
+        """
+        Remove the content of a stage cell, including all child cells which are not used by other stages
+        @param cell_index: index of the stage cell
+        """
+        called = set(self.lay.cell(cell_index).called_cells())
+        self.lay.cell(cell_index).prune_subcells(-1)
+        self.lay.cell(cell_index).clear()
+        # forget the deleted pcell variants
+        self._cells = {key: index for key, index in self._cells.items()
+                       if index not in called or self.lay.is_valid_cell_index(index)}
+
+    def _boolean_incremental(self, dirty_boxes):
+        """
+        Boolean operations of the incremental mode. The fused expression is evaluated per tile, only tiles touching a
+        changed area are recomputed
+        @param dirty_boxes: changed areas in database units
+        """
+        top = self.lay.cell("TOP")
+        chip = pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                       self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu)
+        tile_size = int(round(self.boolean_tile_size/self.dbu))
+
+        if self._tile_grid != (self.chip_size, self.boolean_tile_size):
+            self._tiles = {}
+            self._tile_grid = (self.chip_size, self.boolean_tile_size)
+
+        nx = int(np.ceil(chip.width()/tile_size))
+        ny = int(np.ceil(chip.height()/tile_size))
+
+        recomputed = 0
+        for ix in range(nx):
+            for iy in range(ny):
+                tile = pya.Box(chip.left + ix*tile_size, chip.bottom + iy*tile_size,
+                               min(chip.left + (ix+1)*tile_size, chip.right),
+                               min(chip.bottom + (iy+1)*tile_size, chip.top))
+                if (ix, iy) in self._tiles and not any(tile.touches(box) for box in dirty_boxes):
+                    continue
+
+                def region(layer):
+                    if layer == 3:
+                        return pya.Region(chip)  # chip boundaries
+                    return pya.Region(top.begin_shapes_rec_touching(self.lay.layer(pya.LayerInfo(layer, 0)), tile))
+
+                self._tiles[(ix, iy)] = _fused_boolean(region) & pya.Region(tile)
+                recomputed += 1
+
+        print(f"performing boolean operations (incremental): {recomputed} of {nx*ny} tiles recomputed")
+
+    def _compose_incremental(self):
+        """
+        Compose the output layout from a copy of the stage layout and the merged boolean results of all tiles
+        """
+        self.lay = self._stage_lay.dup()
+        self.top = self.lay.cell("TOP")
+
+        if self.do_boolean:
+            self.top.shapes(self.lay.layer(pya.LayerInfo(3, 0))).insert(
+                pya.Box(-self.chip_size[0]/2/self.dbu, -self.chip_size[1]/2/self.dbu,
+                        self.chip_size[0]/2/self.dbu, self.chip_size[1]/2/self.dbu))
+
+            reference = None
+            if self.boolean_check:
+                reference = self.lay.dup()
+                self._boolean_processor(reference, reference.cell("TOP"))
+
+            result = pya.Region()
+            for tile in self._tiles.values():
+                result += tile
+            self._finish_boolean(result.merged())
+
+            if reference is not None:
+                self._check_boolean_result(reference)
+
     def _rotate_design(self):
         """
         Rotate the whole design by the global rotation
@@ -851,19 +1532,116 @@ class ChipBuilder:
         Save the created chip design as a file
         @param save_name: name of the file
         @param file_format: file format, currently 'gds' and 'dxf' are supported
+        @return: path of the saved file
         """
         print("Saving file...")
 
         Path("../../chips/").mkdir(parents=True, exist_ok=True)
 
         if file_format.lower() == 'gds':
-            self.lay.write("../../chips/" + save_name + ".gds")
+            path = "../../chips/" + save_name + ".gds"
+            self.lay.write(path)
         elif file_format.lower() == 'dxf':
             options = pya.SaveLayoutOptions()
             options.dxf_polygon_mode = 1
             options.dbu = self.lay.dbu
             options.scale_factor = 1
             options.format="DXF"
-            self.lay.write("../../chips/" + save_name + ".dxf", options)
+            path = "../../chips/" + save_name + ".dxf"
+            self.lay.write(path, options)
         else:
             raise ValueError(f"File format '{file_format}' is currently unsupported.")
+        return path
+
+
+@lru_cache(maxsize=None)
+def _pcell_parameters(cell_name: str) -> frozenset:
+    """
+    Parameter names of a pcell of the library
+    @param cell_name: name of the pcell
+    @return: set of parameter names, empty for unknown cells
+    """
+    declaration = pya.Library.library_by_name(lib_name).layout().pcell_declaration(cell_name)
+    return frozenset(p.name for p in declaration.get_parameters()) if declaration is not None else frozenset()
+
+
+def _vertex_count(cell: pya.Cell) -> int:
+    """
+    Amount of polygon vertices of a cell including its child cells
+    @param cell: the cell
+    @return: vertex count
+    """
+    return sum(polygon.num_points() for layer in cell.layout().layer_indexes()
+               for polygon in pya.Region(cell.begin_shapes_rec(layer)).each())
+
+
+def _freeze(params: dict) -> tuple:
+    """
+    Hashable representation of a pcell parameter dictionary
+    @param params: parameter dictionary
+    @return: sorted tuple of (name, value) pairs
+    """
+    def freeze_value(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (pya.LayerInfo, list)):
+            return str(value)
+        return value
+
+    return tuple(sorted((name, freeze_value(value)) for name, value in params.items()))
+
+
+# tolerance of the boolean regression check in database units
+boolean_check_tolerance = 1
+
+# fused boolean expression for the TilingProcessor, identical to _fused_boolean (with the unions of the keep out layers
+# resolved)
+_TILED_BOOLEAN = "_output(result, _tile & ((l1 - l110) | (l13 & (l11 - (l10 + l110) - l15)) | " \
+                 "((l12 & l3) - (l11 + l10 + l110 + l14 + l2 + l15)) | l0))"
+
+
+def _stage_hash(*inputs) -> str:
+    """
+    Hash of the inputs of a stage of the incremental build
+    @param inputs: values, lists and parameter dictionaries
+    @return: hex digest
+    """
+    def freeze(value):
+        if isinstance(value, dict):
+            return _freeze(value)
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    return hashlib.sha1(repr(freeze(inputs)).encode()).hexdigest()
+
+
+def _fused_boolean(region):
+    """
+    Fused boolean expression for the main layer, equivalent to the ShapeProcessor chain in _boolean_processor
+    @param region: function returning the region of a given layer number
+    @return: region of the final main layer
+    """
+    finger = region(110)  # finger (remove resonator gap)
+    spacing = region(10) + finger  # spacing, including fingers
+    hd_mask = region(11) - spacing  # make sure ground is also at high density holes
+    keep_out = hd_mask + spacing + region(14) + region(2) + region(15)  # hd mask, ground, logos, text, airbridge pads
+
+    periodic_holes = (region(12) & region(3)) - keep_out
+    hd_holes = region(13) & (hd_mask - region(15))
+
+    return (region(1) - finger) | hd_holes | periodic_holes | region(0)
+
+
+def _build_chip_worker(job) -> dict:
+    """
+    Worker for ChipBuilder.build_many. Importing this module registers the QCL library in the worker process.
+    @param job: tuple of (ChipBuilder, save_name, file_format)
+    @return: dictionary with the name, path and build time (in s) of the chip
+    """
+    builder, save_name, file_format = job
+    start = time.perf_counter()
+    path = builder.build_chip(save_name, file_format)
+    return {"name": save_name, "path": os.path.abspath(path), "time": time.perf_counter() - start}
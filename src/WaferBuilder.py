@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from pathlib import Path
+import hashlib
+import time
 
 import klayout.db as pya
 import numpy as np
 import os
 
+import src.library.WaferPlacement as WaferPlacement
+
 
 class WaferBuilder:
 
@@ -23,39 +27,77 @@ class WaferBuilder:
         self.spacing_y = spacing_y
 
         self.chip_list = []
+        self.chip_pitches = None  # pitch (chip size + street) per chip position for mixed chip sizes
 
-        x = -int(spacing_x/2)
-        y = -int(spacing_y/2)
+        fill_factor = 0.8  # 80% of the radius will be used (doesn't take chip dimensions into account)
 
-        self.chip_positions = [(x, y)]  # center positions of the grid
+        # center positions of the grid inside the bounding box, sorted by ascending distance from origin
+        positions = WaferPlacement.grid_positions(spacing_x, spacing_y, wafer_diameter/2*fill_factor,
+                                                  origin=(-int(spacing_x/2), -int(spacing_y/2)),
+                                                  bounding_box=bounding_box)
+        self.chip_positions = [tuple(p) for p in positions.tolist()]
 
-        fill_factor = 0.8  # 80% of the radius will be used (doesn't take chip dimensions into account)
+    def optimize_placement(self, chip_sizes=None, street=100, edge_exclusion=3000, flat=True, offset_steps=16,
+                           exclusion_zones=None) -> WaferBuilder:
+        """
+        Replace the chip positions by an optimized placement taking the real chip sizes into account. Chips of equal size
+        are placed on a common grid with the best offset, chips of mixed sizes are packed into shelves. The amount of
+        chips is compared to the previous positions
+        @param chip_sizes: either a single (width, height) for all chips, a list with the (width, height) of each chip of
+                           the chip list, or None for the bounding boxes of the chip files
+        @param street: width of the dicing streets between the chips
+        @param edge_exclusion: width of the unusable ring at the wafer edge
+        @param flat: if True, the wafer has a flat at the bottom (as the drawn wafer outline)
+        @param offset_steps: amount of offsets per axis for the search of the grid or shelf offset
+        @param exclusion_zones: list of rectangles [(ll_x, ll_y), (ur_x, ur_y)] which chips of equal size must not
+                                overlap, e.g. alignment or test structure areas
+        @return: self for chaining
+        """
+        if chip_sizes is None:
+            chip_sizes = self._chip_sizes()
+        elif np.ndim(chip_sizes) == 1:
+            chip_sizes = [tuple(chip_sizes)]*max(len(self.chip_list), 1)
+        chip_sizes = [(float(w), float(h)) for w, h in chip_sizes]
+        if len(chip_sizes) == 0:
+            raise ValueError("No chip sizes given and the chip list is empty!")
 
-        # init the chip positions (not really optimized, but also no need to)
-        for i in range(1, int(wafer_diameter/min(spacing_x, spacing_y))):
-            s = 1 if i % 2 else -1
-            for _ in range(i):
-                x += s*spacing_x
-                if (x**2 + y**2) > (wafer_diameter/2*fill_factor)**2:
-                    continue
-                self.chip_positions.append((x, y))
-            for _ in range(i):
-                y += s*spacing_y
-                if (x**2 + y**2) > (wafer_diameter/2*fill_factor)**2:
-                    continue
-                self.chip_positions.append((x, y))
-
-        # constrain to positions inside the bounding box
-        if bounding_box is not None:
-            constraint_pos = []
-            for pos in self.chip_positions:
-                if bounding_box[0][0] <= pos[0] <= bounding_box[1][0] and \
-                   bounding_box[0][1] <= pos[1] <= bounding_box[1][1]:  # x (^) and y (<) okay
-                    constraint_pos.append(pos)
-            self.chip_positions = constraint_pos
-
-        # sort chip positions by ascending distance from origin
-        self.chip_positions.sort(key=lambda r: r[0]**2+r[1]**2)
+        radius = self.wafer_diameter/2
+        flat_y = WaferPlacement.flat_position(radius) if flat else None
+
+        # previous positions, chips assigned in order
+        old = self.chip_positions
+        if len(set(chip_sizes)) == 1:
+            old_sizes = [chip_sizes[0]]*len(old)
+        else:
+            old = old[:len(chip_sizes)]
+            old_sizes = chip_sizes[:len(old)]
+        old_valid = int(np.count_nonzero(WaferPlacement.chip_mask(
+            [p[0] for p in old], [p[1] for p in old], np.array([s[0] for s in old_sizes]),
+            np.array([s[1] for s in old_sizes]), radius, flat_y, edge_exclusion))) if old_sizes else 0
+
+        if len(set(chip_sizes)) == 1:
+            width, height = chip_sizes[0]
+            positions = WaferPlacement.grid_placement(width, height, radius, flat_y, edge_exclusion, street,
+                                                      offset_steps, self.bounding_box, exclusion_zones)
+            self.chip_positions = [tuple(p) for p in positions.tolist()]
+            self.spacing_x, self.spacing_y = width + street, height + street
+            self.chip_pitches = None
+        else:
+            positions = WaferPlacement.shelf_placement(chip_sizes, radius, flat_y, edge_exclusion, street,
+                                                       offset_steps)
+            placed = [i for i, p in enumerate(positions) if p is not None and self._in_bounding_box(p)]
+            skipped = [i for i in range(len(self.chip_list)) if i not in placed]
+            if skipped:
+                print(f"{len(skipped)} chips do not fit onto the wafer")
+            # placed chips first, so that create_wafer assigns them to their positions
+            self.chip_list = [self.chip_list[i] for i in placed + skipped]
+            self.chip_positions = [positions[i] for i in placed]
+            self.chip_pitches = [(chip_sizes[i][0] + street, chip_sizes[i][1] + street) for i in placed]
+
+        print(f"Placement: {len(self.chip_positions)} chips per wafer instead of {old_valid} "
+              f"({len(self.chip_positions) - old_valid:+d}; {len(old) - old_valid} of the {len(old)} previous "
+              f"positions violate the wafer edge)")
+        return self
 
     def add_chip(self, path: str) -> WaferBuilder:
         """
@@ -80,6 +122,31 @@ class WaferBuilder:
                 self.chip_list.append(f"{path}/{filename.split('.')[0]}")
         return self
 
+    def _chip_sizes(self) -> [tuple]:
+        """
+        Sizes of the chips of the chip list, given by the bounding boxes of the chip files
+        @return: list of (width, height)
+        """
+        sizes = {}
+        for chip in self.chip_list:
+            if chip not in sizes:
+                aux = pya.Layout()
+                aux.read(chip + ".gds")
+                bbox = aux.top_cell().dbbox()
+                sizes[chip] = (bbox.width(), bbox.height())
+        return [sizes[chip] for chip in self.chip_list]
+
+    def _in_bounding_box(self, position) -> bool:
+        """
+        Check the bounding box constraint
+        @param position: chip center (x, y)
+        @return: True, if there is no constraint or the position is inside the bounding box
+        """
+        if self.bounding_box is None:
+            return True
+        return self.bounding_box[0][0] <= position[0] <= self.bounding_box[1][0] and \
+            self.bounding_box[0][1] <= position[1] <= self.bounding_box[1][1]
+
     def _add_prefixed_chip_folder(self, path: str, prefix: str) -> WaferBuilder:
         """
         Load all chips (i.e. all files having a .gds format) from a folder with a given prefix, each of them with the given
@@ -94,10 +161,13 @@ class WaferBuilder:
                 self.chip_list.append(f"{path}/{filename.split('.')[0]}")
         return self
 
-    def create_wafer(self, save_name: str):
+    def create_wafer(self, save_name: str, streaming=False):
         """
         Creates a GDS wafer file from a given chip list.
         @param save_name: Name of the wafer
+        @param streaming: if True, the wafer is written hierarchically, i.e. repeated chips are references to a single
+                          cell. Nothing is flattened, so the memory scales with the amount of distinct chips instead of
+                          the amount of placements
         """
         lay = pya.Layout()
         main_cell = lay.create_cell("WAFER")
@@ -122,29 +192,110 @@ class WaferBuilder:
             # raise ValueError("Cannot fit all chips onto the wafer!")
             pass  # do not care, rather fill up as much as possible
 
-        idx = 0
-        for chip in self.chip_list:
+        # registry of the distinct chips, each chip file is read once, identical files are detected by their content
+        chip_hashes = {}  # chip path -> content hash
+        chip_cells = {}  # content hash -> cell index
+        placements = {}  # cell index -> list of chip positions
 
-            if idx == len(self.chip_positions):
-                break
+        start = time.perf_counter()
+        read_time = 0
+
+        for idx, (chip, (x, y)) in enumerate(zip(self.chip_list, self.chip_positions)):
+            if chip not in chip_hashes:
+                chip_hashes[chip] = _content_hash(chip + ".gds")
+            digest = chip_hashes[chip]
 
-            print(f"reading chip '{chip}'")
-            lay.read(chip + ".gds")
-            chip_cell = lay.top_cells()[1].cell_index()
-            x, y = self.chip_positions[idx]
-            main_cell.insert(pya.DCellInstArray(chip_cell, pya.DCplxTrans.new(1, 0, False, x, y)))
-            mark_trans = pya.DCplxTrans.new(1, 0, False, (x-self.spacing_x/2)/dbu, (y-self.spacing_y/2)/dbu)
+            if digest not in chip_cells:
+                print(f"reading chip '{chip}'")
+                read_start = time.perf_counter()
+                chip_cells[digest] = _import_chip(lay, chip)
+                read_time += time.perf_counter() - read_start
+
+            placements.setdefault(chip_cells[digest], []).append((x, y))
+
+            pitch_x, pitch_y = self.chip_pitches[idx] if self.chip_pitches else (self.spacing_x, self.spacing_y)
+            mark_trans = pya.DCplxTrans.new(1, 0, False, (x-pitch_x/2)/dbu, (y-pitch_y/2)/dbu)
             mark = _mark(300/dbu, 5/dbu)
             main_cell.shapes(lay.layer(1, 0)).insert(mark.transform(mark_trans))
-            idx += 1
 
-            main_cell.flatten(1)  # flatten to remove the top cell of the resonator
+        # place repeated chips as arrays
+        amount = 0
+        arrays = 0
+        for chip_cell, positions in placements.items():
+            for x, y, nx, ny in _grid_arrays(positions, self.spacing_x, self.spacing_y):
+                main_cell.insert(pya.DCellInstArray(chip_cell, pya.DCplxTrans.new(1, 0, False, x, y),
+                                                    pya.DVector(self.spacing_x, 0), pya.DVector(0, self.spacing_y),
+                                                    nx, ny))
+                amount += nx*ny
+                arrays += 1
+
+        if not streaming:
+            main_cell.flatten(1)  # flatten to remove the top cells of the chips
+
+        print(f"{amount} chips ({len(chip_cells)} distinct) placed as {arrays} instance arrays; "
+              f"reading {read_time:.1f} s, placement {time.perf_counter() - start - read_time:.1f} s")
 
         print("Saving file...")
         Path("../../wafers/").mkdir(parents=True, exist_ok=True)
         lay.write(f"../../wafers/{save_name}.gds")
 
 
+def _import_chip(lay: pya.Layout, path: str) -> int:
+    """
+    Import a chip as a hierarchical cell. The file is read into its own layout, which is released after copying, so
+    only the copied cell tree stays in memory
+    @param lay: wafer layout
+    @param path: path of the chip without file extension
+    @return: cell index of the chip in the wafer layout
+    """
+    aux = pya.Layout()
+    aux.read(path + ".gds")
+    cell = lay.create_cell(Path(path).name)
+    cell.copy_tree(aux.top_cell())
+    return cell.cell_index()
+
+
+def _content_hash(path: str) -> str:
+    """
+    Hash of the content of a file, for detecting identical chips with different file names
+    @param path: path of the file
+    @return: hex digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _grid_arrays(positions, spacing_x, spacing_y) -> [tuple]:
+    """
+    Combine chip positions on the grid into rectangular arrays. Neighbouring positions of a row are combined into row
+    arrays first, identical row arrays of neighbouring rows are then stacked
+    @param positions: list of (x, y) chip positions
+    @param spacing_x: x spacing of the chip grid
+    @param spacing_y: y spacing of the chip grid
+    @return: list of arrays (x, y, nx, ny), (x, y) being the position of the lower left chip
+    """
+    rows = []  # [x, y, nx]
+    for x, y in sorted(positions, key=lambda p: (p[1], p[0])):
+        if rows and np.isclose(rows[-1][1], y) and np.isclose(rows[-1][0] + rows[-1][2]*spacing_x, x):
+            rows[-1][2] += 1
+        else:
+            rows.append([x, y, 1])
+
+    arrays = []  # [x, y, nx, ny]
+    for x, y, nx in rows:
+        for array in arrays:
+            if np.isclose(array[0], x) and array[2] == nx and np.isclose(array[1] + array[3]*spacing_y, y):
+                array[3] += 1
+                break
+        else:
+            arrays.append([x, y, nx, 1])
+
+    return [tuple(array) for array in arrays]
+
+
 def _mark(l: float, w: float):
     """
     Helper for creating dicing marks.
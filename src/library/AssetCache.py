@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import klayout.db as pya
+
+"""
+Process wide cache for template GDS files (markers, logos, fonts, hole masks). Each file is parsed once into an
+in-memory layout, from which cells are copied into the target layouts. Entries are invalidated when the file changes and
+evicted in least recently used order once the cached files exceed max_cache_size.
+"""
+
+template_dir = "../../templates/"
+max_cache_size = 256e6  # summed size of the cached files in bytes, as an estimate of the memory footprint
+
+_assets = OrderedDict()  # resolved path -> (mtime, file size, layout)
+
+
+def template_path(name: str) -> str:
+    """
+    Path of a template GDS file
+    @param name: name of the template without file extension, e.g. 'marker_LW'
+    @return: path of the file
+    """
+    return f"{template_dir}{name}.gds"
+
+
+def get_layout(path) -> pya.Layout:
+    """
+    Get the parsed layout of a GDS file, reading it if it is not cached yet or has changed since. The returned layout
+    is shared and must not be modified
+    @param path: path of the file
+    @return: the layout
+    """
+    key = str(Path(path).resolve())
+    stat = Path(key).stat()
+
+    entry = _assets.get(key)
+    if entry is not None and entry[0] == stat.st_mtime:
+        _assets.move_to_end(key)  # mark as recently used
+        return entry[2]
+
+    layout = pya.Layout()
+    layout.read(key)
+
+    _assets[key] = (stat.st_mtime, stat.st_size, layout)
+    _assets.move_to_end(key)
+    _evict(keep=key)
+    return layout
+
+
+def copy_cell(layout: pya.Layout, path, name=None) -> pya.Cell:
+    """
+    Copy the top cell of a GDS file including its child cells into a layout. Raises, if the file has several top cells
+    @param layout: target layout
+    @param path: path of the file
+    @param name: name of the new cell, by default the name of the top cell of the file
+    @return: the new cell in the target layout
+    """
+    source = get_layout(path).top_cell()
+    cell = layout.create_cell(name or source.name)
+    cell.copy_tree(source)
+    return cell
+
+
+def clear_cache():
+    """
+    Remove all cached layouts
+    """
+    _assets.clear()
+
+
+def _evict(keep: str):
+    """
+    Remove the least recently used layouts until the cache is smaller than max_cache_size
+    @param keep: path of a layout that is never removed
+    """
+    size = sum(entry[1] for entry in _assets.values())
+
+    for key in list(_assets):
+        if size <= max_cache_size:
+            break
+        if key == keep:
+            continue
+        size -= _assets.pop(key)[1]
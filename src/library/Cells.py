@@ -35,7 +35,8 @@ class Curve(CellObject):
     """
     CPW curve
     """
-    def __init__(self, radius=101, angle=90, right_curve=1, width=10, gap=6, ground=50, hole=40, resolution=90):
+    def __init__(self, radius=101, angle=90, right_curve=1, width=10, gap=6, ground=50, hole=40, resolution=90,
+                 chord_error=0):
         self.radius = radius
         self.angle = angle
         self.right_curve = right_curve
@@ -44,6 +45,7 @@ class Curve(CellObject):
         self.ground = ground
         self.hole = hole
         self.resolution=resolution
+        self.chord_error = chord_error  # in dbu, if > 0 the resolution is chosen adaptively
         pass
 
     def end_point(self):
@@ -73,7 +75,8 @@ class Curve(CellObject):
         :@return: a dictionary containing all parameters
         """
         return {"radius": self.radius, "angle": self.angle, "right_curve": self.right_curve, "width": self.width,
-                "gap": self.gap, "ground": self.ground, "hole": self.hole, "resolution": self.resolution}
+                "gap": self.gap, "ground": self.ground, "hole": self.hole, "resolution": self.resolution,
+                "chord_error": self.chord_error}
 
 
 class Port(CellObject):
@@ -235,7 +238,7 @@ class EndPart(CellObject):
 
 class HoleMask(CellObject):
 
-    def __init__(self, width, height, spacing, sigma, size, hd_holes):
+    def __init__(self, width, height, spacing, sigma, size, hd_holes, seed=-1):
         """
         Initializes hole parameters.
         :@param cp: Related chip params
@@ -243,12 +246,14 @@ class HoleMask(CellObject):
         :@param hole_sigma: Random position offset of the holes
         :@param hole_size: Size of the holes
         :@param hd_holes: True if params are used for high density holes
+        :@param seed: Seed for the random position offsets, -1 for a random seed
         """
         self.width = width
         self.height = height
         self.spacing = spacing
         self.sigma = sigma
         self.size = size
+        self.seed = seed
 
         self.lay = pya.LayerInfo(12, 0) if not hd_holes else pya.LayerInfo(13, 0)
         
@@ -261,7 +266,7 @@ class HoleMask(CellObject):
         :@return: a dictionary containing all parameters
         """
         return {"lay": self.lay, "width": self.width, "height": self.height, "spacing": self.spacing,
-                "sigma": self.sigma, "size": self.size}
+                "sigma": self.sigma, "size": self.size, "seed": self.seed}
 
 
 class Decorator(CellObject):
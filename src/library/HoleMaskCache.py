@@ -0,0 +1,74 @@
+import hashlib
+import os
+from pathlib import Path
+
+"""
+Content addressed cache for generated hole masks. Masks are identified by their generation parameters, generated on a
+cache miss and evicted in least recently used order once the cache directory exceeds its size limit.
+"""
+
+cache_dir = "../../cache/hole_masks/"
+max_cache_size = 2e9  # in bytes
+
+
+def get_hole_mask(width, height, l_spacing=50, l_sigma=2, l_size=2, hd_spacing=10, hd_sigma=2, hd_size=2,
+                  seed=0) -> str:
+    """
+    Get the path of a hole mask with the given parameters, generating the mask if it is not cached yet
+    @param width: width of the mask
+    @param height: height of the mask
+    @param l_spacing: spacing of the periodic holes
+    @param l_sigma: random offset of the periodic holes
+    @param l_size: size of the periodic holes
+    @param hd_spacing: spacing of the high density holes
+    @param hd_sigma: random offset of the high density holes
+    @param hd_size: size of the high density holes
+    @param seed: seed for the random offsets
+    @return: path to the .gds file of the mask
+    """
+    key = (width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size, seed)
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    path = Path(cache_dir) / f"{name}.gds"
+
+    if path.exists():
+        os.utime(path)  # mark as recently used
+        return str(path)
+
+    print("No cached hole mask found. Generating new hole mask...")
+
+    from src.scripts.HoleGenerator import HoleGenerator
+
+    # write to a temporary file first, so that parallel builds never read a partially written mask
+    tmp_name = f"{name}.{os.getpid()}.tmp"
+    HoleGenerator().create_hole_mask(tmp_name, width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma,
+                                     hd_size, seed=seed, directory=cache_dir)
+    os.replace(Path(cache_dir) / f"{tmp_name}.gds", path)
+
+    _evict(keep=path)
+    return str(path)
+
+
+def clear_cache():
+    """
+    Remove all cached hole masks
+    """
+    for file in Path(cache_dir).glob("*.gds"):
+        file.unlink(missing_ok=True)
+
+
+def _evict(keep: Path):
+    """
+    Remove the least recently used masks until the cache is smaller than max_cache_size
+    @param keep: path of a mask that is never removed
+    """
+    files = [(f, f.stat()) for f in Path(cache_dir).glob("*.gds") if not f.name.endswith(".tmp.gds")]
+    files.sort(key=lambda f: f[1].st_mtime)
+    size = sum(stat.st_size for _, stat in files)
+
+    for file, stat in files:
+        if size <= max_cache_size:
+            break
+        if file == keep:
+            continue
+        size -= stat.st_size
+        file.unlink(missing_ok=True)  # might have been removed by a parallel build
@@ -1,6 +1,8 @@
 import klayout.db as pya
 import numpy as np
 
+from src.library.KLayout.Curve import arc_resolution
+
 
 class AirbridgeRound(pya.PCellDeclarationHelper):
     """
@@ -15,6 +17,7 @@ class AirbridgeRound(pya.PCellDeclarationHelper):
         self.param("gap", self.TypeDouble, "gap between the pads", default=30)
         self.param("bridge_pad_radius", self.TypeDouble, "width of the bridge pad", default=80)
         self.param("bridge_width", self.TypeDouble, "width of the bridge", default=40)
+        self.param("chord_error", self.TypeDouble, "max. chord error in dbu (0: 100 points per circle)", default=0)
 
     def display_text_impl(self):
         # Provide a descriptive text for the cell
@@ -31,13 +34,14 @@ class AirbridgeRound(pya.PCellDeclarationHelper):
         gap = self.gap / dbu
         bridge_pad_radius = self.bridge_pad_radius / dbu
         bridge_width = self.bridge_width / dbu
+        chord_error = self.chord_error
         # create shape
 
-        create_airbridge(self, pya.DPoint(0, 0), 0, pad_radius, gap, bridge_pad_radius, bridge_width)
+        create_airbridge(self, pya.DPoint(0, 0), 0, pad_radius, gap, bridge_pad_radius, bridge_width, chord_error)
 
 
 # angle in degrees
-def create_airbridge(obj, start, rotation, pad_radius, gap, bridge_pad_radius, bridge_width):
+def create_airbridge(obj, start, rotation, pad_radius, gap, bridge_pad_radius, bridge_width, chord_error=0):
 
     p_u_list = []  # upper pad list
     p_l_list = []  # lower pad list
@@ -50,8 +54,12 @@ def create_airbridge(obj, start, rotation, pad_radius, gap, bridge_pad_radius, b
     x = 0
     y = gap/2 + pad_radius/1.5
 
-    for i in range(100):
-        phi = i*2*np.pi/100
+    # the last point of the full circle coincides with the first one
+    res = 100 if chord_error <= 0 else arc_resolution(max(pad_radius, bridge_pad_radius), 360, chord_error) - 1
+    res = max(res, 8)
+
+    for i in range(res):
+        phi = i*2*np.pi/res
         p_u_list.append(pya.DPoint(x + np.sin(phi)*pad_radius, y + np.cos(phi)*pad_radius))
         p_l_list.append(pya.DPoint(x + np.sin(phi)*pad_radius, -y + np.cos(phi)*pad_radius))
 
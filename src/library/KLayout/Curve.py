@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import klayout.db as pya
 import numpy as np
 
@@ -22,6 +24,7 @@ class Curve(pya.PCellDeclarationHelper):
         self.param("ground", self.TypeDouble, "ground", default=50)
         self.param("hole", self.TypeDouble, "hole mask", default=40)
         self.param("resolution", self.TypeInt, "Angle resolution", default=90)
+        self.param("chord_error", self.TypeDouble, "max. chord error in dbu (0: fixed resolution)", default=0)
 
     def display_text_impl(self):
         # Provide a descriptive text for the cell
@@ -42,63 +45,36 @@ class Curve(pya.PCellDeclarationHelper):
         ground = self.ground / dbu
         hole = self.hole / dbu
         resolution = self.resolution
+        chord_error = self.chord_error
         # create shape
 
-        create_curve(self, pya.DPoint(0, 0), 0, radius, angle, right_curve, width, gap, ground, hole, resolution)
+        create_curve(self, pya.DPoint(0, 0), 0, radius, angle, right_curve, width, gap, ground, hole, resolution,
+                     chord_error)
 
 
 # angle in degrees
-def create_curve(obj, start, rotation, radius, angle, right_curve, width, gap, ground, hole, resolution):
-    dbu = obj.layout.dbu
-    g_u_list = []
-    g_l_list = []
-    mask_list = []
-    hole_u_list = []
-    hole_l_list = []
+def create_curve(obj, start, rotation, radius, angle, right_curve, width, gap, ground, hole, resolution=90,
+                 chord_error=0):
 
     # min radius check
     # radius = max(radius, width/2+gap+ground+hole)
 
-    res = resolution  # 90
-
     # define outer radius as the full circle to the upper hd hole mask
     outer_radius = radius + width/2 + gap + ground + hole
 
-    p_hu = outer_radius
-    p_m = outer_radius-hole
-    p_gu = outer_radius-hole-ground
-    p_gl = outer_radius-hole-ground-gap-width
-    p_hl = outer_radius-hole-2*ground-2*gap-width
+    # outer and inner radii of the upper hole mask, mask, upper gap, lower gap and lower hole mask
+    p_outer = np.array([outer_radius, outer_radius-hole, outer_radius-hole-ground,
+                        outer_radius-hole-ground-gap-width, outer_radius-hole-2*ground-2*gap-width])
+    p_inner = p_outer - np.array([hole, 2*ground+2*gap+width, gap, gap, hole])
 
     mag = radius
 
-    for phi in np.linspace(0, angle, res):
-
-        ux = np.sin(phi*np.pi/180)
-        uy = np.cos(phi*np.pi/180)
-
-        hole_u_list.append(pya.DPoint(ux*p_hu, uy*p_hu-mag))
-        mask_list.append(pya.DPoint(ux*p_m, uy*p_m-mag))
-        g_u_list.append(pya.DPoint(ux*p_gu, uy*p_gu-mag))
-        g_l_list.append(pya.DPoint(ux*p_gl, uy*p_gl-mag))
-        hole_l_list.append(pya.DPoint(ux*p_hl, uy*p_hl-mag))
+    res = resolution if chord_error <= 0 else arc_resolution(outer_radius, angle, chord_error)
+    ux, uy = unit_arc(angle, res)
 
-    p_hu = p_hu-hole
-    p_m = p_m-2*ground-2*gap-width
-    p_gu = p_gu-gap
-    p_gl = p_gl-gap
-    p_hl = p_hl-hole
-
-    for phi in np.linspace(angle, 0, res):
-
-        ux = np.sin(phi*np.pi/180)
-        uy = np.cos(phi*np.pi/180)
-
-        hole_u_list.append(pya.DPoint(ux*p_hu, uy*p_hu-mag))
-        mask_list.append(pya.DPoint(ux*p_m, uy*p_m-mag))
-        g_u_list.append(pya.DPoint(ux*p_gu, uy*p_gu-mag))
-        g_l_list.append(pya.DPoint(ux*p_gl, uy*p_gl-mag))
-        hole_l_list.append(pya.DPoint(ux*p_hl, uy*p_hl-mag))
+    # all five contours at once, going along the outer radius and back along the inner radius
+    xs = np.concatenate([np.outer(p_outer, ux), np.outer(p_inner, ux[::-1])], axis=1)
+    ys = np.concatenate([np.outer(p_outer, uy), np.outer(p_inner, uy[::-1])], axis=1) - mag
 
     shift = pya.ICplxTrans(1, rotation, not right_curve, start.x, start.y)
 
@@ -106,15 +82,48 @@ def create_curve(obj, start, rotation, radius, angle, right_curve, width, gap, g
     l10 = obj.layout.layer(10, 0)
     l11 = obj.layout.layer(11, 0)
 
-    obj.cell.shapes(l11).insert(pya.Polygon(hole_u_list).transformed(shift))
-    obj.cell.shapes(l10).insert(pya.Polygon(mask_list).transformed(shift))
-    obj.cell.shapes(l1).insert(pya.Polygon(g_u_list).transformed(shift))
-    obj.cell.shapes(l1).insert(pya.Polygon(g_l_list).transformed(shift))
-    obj.cell.shapes(l11).insert(pya.Polygon(hole_l_list).transformed(shift))
+    hole_u, mask, g_u, g_l, hole_l = (pya.Polygon([pya.DPoint(x, y) for x, y in zip(x_ring, y_ring)])
+                                      for x_ring, y_ring in zip(xs.tolist(), ys.tolist()))
+
+    obj.cell.shapes(l11).insert(hole_u.transformed(shift))
+    obj.cell.shapes(l10).insert(mask.transformed(shift))
+    obj.cell.shapes(l1).insert(g_u.transformed(shift))
+    obj.cell.shapes(l1).insert(g_l.transformed(shift))
+    obj.cell.shapes(l11).insert(hole_l.transformed(shift))
 
     return shift*pya.DPoint(mag*np.sin(angle*np.pi/180), mag*np.cos(angle*np.pi/180)-mag)
 
 
+@lru_cache(maxsize=256)
+def unit_arc(angle, resolution) -> (np.ndarray, np.ndarray):
+    """
+    Unit circle table for an arc, starting at the top of the circle and going clockwise. The cache is bounded, as the
+    adaptive resolution produces continuous angle and resolution pairs
+    @param angle: opening angle in degrees
+    @param resolution: amount of points
+    @return: read-only arrays of sin and cos values
+    """
+    phi = np.linspace(0, angle, resolution)*np.pi/180
+    ux, uy = np.sin(phi), np.cos(phi)
+    ux.flags.writeable = False
+    uy.flags.writeable = False
+    return ux, uy
+
+
+def arc_resolution(radius, angle, chord_error) -> int:
+    """
+    Amount of points for an arc, such that the chords deviate at most by the chord error from the circle
+    @param radius: radius of the arc
+    @param angle: opening angle in degrees
+    @param chord_error: maximum deviation between chord and arc, in the units of the radius
+    @return: amount of points, at least 2
+    """
+    if radius <= chord_error:
+        return 2
+    step = 2*np.arccos(1-chord_error/radius)
+    return max(2, int(np.ceil(abs(angle)*np.pi/180/step))+1)
+
+
 def end_point(radius, angle, right_curve, width, gap, ground, hole):
     mag = radius - width/2 - gap - ground - hole
     mag = radius
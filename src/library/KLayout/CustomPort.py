@@ -1,6 +1,8 @@
 import klayout.db as pya
 import numpy as np
 
+from src.library.KLayout.Port import contour, unit_taper
+
 
 class CustomPort(pya.PCellDeclarationHelper):
     """
@@ -58,57 +60,34 @@ def create_smooth_port(obj, start, length_taper, length_port, width_port, gap_po
     @param ground: ground size (area without holes)
     @param hole: high density hole mask
     """
-    gap_list = []
-    mask_list = []
-    hole_list = []
-
-    hole_list.append(pya.DPoint(0, width_port/2+gap_port+ground+hole))
-    mask_list.append(pya.DPoint(hole, width_port/2+gap_port+ground))
-    gap_list.append(pya.DPoint(hole+ground, width_port/2+gap_port))
-
     x_offset = hole + ground + gap_port + length_port
 
     res = 50
 
-    for z in np.linspace(0, 1, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_height(z)*gap_port + (1-get_height(z))*gap_cpw
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground + hole))
-        mask_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g))
-
-    for z in np.linspace(1, 0, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_height(z)*gap_port + (1-get_height(z))*gap_cpw
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground))
-        mask_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, h_w))
-
-    hole_list.append(pya.DPoint(hole, width_port/2+gap_port+ground))
-    mask_list.append(pya.DPoint(hole, -(width_port/2+gap_port+ground)))
-    gap_list.append(pya.DPoint(hole+ground+gap_port, width_port/2))
-
-    hole_list.append(pya.DPoint(hole, -(width_port/2+gap_port+ground)))
-    gap_list.append(pya.DPoint(hole+ground+gap_port, -width_port/2))
-
-    for z in np.linspace(0, 1, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_height(z)*gap_port + (1-get_height(z))*gap_cpw
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, -h_w))
-
-    for z in np.linspace(1, 0, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_height(z)*gap_port + (1-get_height(z))*gap_cpw
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground + hole)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g)))
-
-    hole_list.append(pya.DPoint(0, -(width_port/2+gap_port+ground+hole)))
-    gap_list.append(pya.DPoint(hole+ground, -(width_port/2+gap_port)))
+    # whole taper profile at once, the contours go along the taper (forward) and back (reversed)
+    z, height = unit_taper(res)
+    x = x_offset + z * length_taper
+    h_w = height*(width_port-width_cpw)/2+width_cpw/2
+    h_g = height*gap_port + (1-height)*gap_cpw
+
+    hole_list = contour([0], [width_port/2+gap_port+ground+hole],
+                        x, h_w + h_g + ground + hole,
+                        x[::-1], (h_w + h_g + ground)[::-1],
+                        [hole, hole], [width_port/2+gap_port+ground, -(width_port/2+gap_port+ground)],
+                        x, -(h_w + h_g + ground),
+                        x[::-1], -(h_w + h_g + ground + hole)[::-1],
+                        [0], [-(width_port/2+gap_port+ground+hole)])
+    mask_list = contour([hole], [width_port/2+gap_port+ground],
+                        x, h_w + h_g + ground,
+                        x[::-1], -(h_w + h_g + ground)[::-1],
+                        [hole], [-(width_port/2+gap_port+ground)])
+    gap_list = contour([hole+ground], [width_port/2+gap_port],
+                       x, h_w + h_g,
+                       x[::-1], h_w[::-1],
+                       [hole+ground+gap_port, hole+ground+gap_port], [width_port/2, -width_port/2],
+                       x, -h_w,
+                       x[::-1], -(h_w + h_g)[::-1],
+                       [hole+ground], [-(width_port/2+gap_port)])
 
     shift = pya.ICplxTrans(1, 0, False, start.x+spacing, start.y)
 
@@ -122,18 +101,5 @@ def create_smooth_port(obj, start, length_taper, length_port, width_port, gap_po
 
     return shift*pya.DPoint(length_taper+length_port+gap_port+ground+hole, 0)
 
-def get_height(z):
-    """
-    Calculates the height to a corresponding x value
-    @param z: x coordinate normalized between 0 and 1
-    @return: the height normalized between 0 and 1. Returns 1 for z=0 and 0 for z=1
-    """
-    if z < 0:
-        return 1
-    if z > 1:
-        return 0
-    return 2*z**3-3*z**2+1
-
-
 def end_point(length_taper, length_port, width_port, gap_port, spacing, width_cpw, gap_cpw, ground, hole):
     return pya.DPoint(length_taper+length_port+gap_port+ground+hole+spacing, 0)
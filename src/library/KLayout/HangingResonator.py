@@ -1,14 +1,14 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
 import klayout.db as pya
 import numpy as np
 import src.library.Cells as Cells
 
-from src.library.KLayout.Straight import create_straight
-from src.library.KLayout.Curve import create_curve
+from src.library.KLayout.Curve import arc_resolution
 from src.library.KLayout.End import create_end
 
-from src.library.KLayout.Straight import end_point as straight_end
-from src.library.KLayout.Curve import end_point as curve_end
-
 
 class HangingResonator(pya.PCellDeclarationHelper):
     """
@@ -34,6 +34,7 @@ class HangingResonator(pya.PCellDeclarationHelper):
         self.param("ground", self.TypeDouble, "ground", default=50)
         self.param("hole", self.TypeDouble, "hole mask", default=40)
         self.param("resolution", self.TypeInt, "angle resolution", default=90)
+        self.param("chord_error", self.TypeDouble, "max. chord error in dbu (0: fixed resolution)", default=0)
 
     def display_text_impl(self):
         # Provide a descriptive text for the cell
@@ -61,72 +62,261 @@ class HangingResonator(pya.PCellDeclarationHelper):
         ground = self.ground / dbu
         hole = self.hole / dbu
         resolution = self.resolution
+        chord_error = self.chord_error
 
         # create shape
-        create_res(self, pya.DPoint(0, 0), 0, segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius, shorted, width_tl, gap_tl, width, gap, ground, hole, resolution)
+        create_res(self, pya.DPoint(0, 0), 0, segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius, shorted, width_tl, gap_tl, width, gap, ground, hole, resolution, chord_error)
 
 
-def create_res(obj, start, rotation, segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius, shorted, width_tl, gap_tl, width, gap, ground, hole, resolution):
+def create_res(obj, start, rotation, segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius, shorted, width_tl, gap_tl, width, gap, ground, hole, resolution, chord_error=0):
 
-    dbu = obj.layout.dbu
+    path = resonator_path(segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius,
+                          width_tl, gap_tl, width, gap)
+    shift = pya.DCplxTrans(1, rotation, False, start.x, start.y)
 
-    curr = pya.DPoint(start.x-segment_length/2+x_offset-coupling_length, start.y+width/2+width_tl/2+gap+gap_tl+coupling_ground)
-    create_end(obj, curr, 180+rotation, 0, width, gap, ground, hole)
+    # open end at the coupling section and (shorted) end of the resonator
+    create_end(obj, shift*pya.DPoint(path.x[0], path.y[0]), 180+rotation, 0, width, gap, ground, hole)
+    end_x, end_y, _ = path.evaluate([length])
+    create_end(obj, shift*pya.DPoint(end_x[0], end_y[0]), float(path.direction([length])[0])+rotation, shorted, width, gap,
+               ground, hole)
 
-    curr = create_straight(obj, curr, rotation, coupling_length, width, gap, ground, hole)
-    length -= coupling_length
-    curr = create_curve(obj, curr, rotation, radius, 90, 0, width, gap, ground, hole, resolution)
-    length -= np.pi/180*radius*90
+    # gap, mask and hole mask by offsetting the whole centerline, one insertion per layer
+    xs, ys = path.centerline(length, resolution, chord_error, width/2+gap+ground+hole)
+    points = [pya.DPoint(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
 
-    if length < y_offset:
-        curr = create_straight(obj, curr, 90+rotation, length, width, gap, ground, hole)
-        create_end(obj, curr, 90+rotation, shorted, width, gap, ground, hole)
-        return
-    curr = create_straight(obj, curr, 90+rotation, y_offset, width, gap, ground, hole)
+    def band(inner, outer):
+        region = pya.Region(pya.Polygon(pya.DPath(points, 2*outer).transformed(shift).polygon()))
+        if inner > 0:
+            region -= pya.Region(pya.Polygon(pya.DPath(points, 2*inner).transformed(shift).polygon()))
+        return region
 
-    length -= y_offset
+    obj.cell.shapes(obj.layout.layer(1, 0)).insert(band(width/2, width/2+gap))
+    obj.cell.shapes(obj.layout.layer(10, 0)).insert(band(0, width/2+gap+ground))
+    obj.cell.shapes(obj.layout.layer(11, 0)).insert(band(width/2+gap+ground, width/2+gap+ground+hole))
 
-    if length < np.pi/180*radius*90:
-        end_angle = 180*length/np.pi/radius
-        curr = create_curve(obj, curr, 90+rotation, radius, end_angle, 0, width, gap, ground, hole, resolution)
-        create_end(obj, curr, 360+end_angle+rotation, shorted, width, gap, ground, hole)
-        return
-    curr = create_curve(obj, curr, 90+rotation, radius, 90, 0, width, gap, ground, hole, resolution)
-    length -= np.pi/180*radius*90
 
-    if x_offset == 0:
-        x_offset = segment_length
-    if length < x_offset:
-        curr = create_straight(obj, curr, 180+rotation, length, width, gap, ground, hole)
-        create_end(obj, curr, 180+rotation, shorted, width, gap, ground, hole)
-        return
+class ResonatorPath:
+    """
+    Piecewise centerline of a hanging resonator, made of straights and circular arcs. The cumulative arc length at the
+    start of each segment is stored, so that positions along the resonator are found with a binary search
+    """
 
-    curr = create_straight(obj, curr, 180+rotation, x_offset, width, gap, ground, hole)
-    # print(f"created straight with offset {x_offset}")
-    length -= x_offset
+    def __init__(self, x, y):
+        """
+        Start an empty path
+        @param x: x coordinate of the start point
+        @param y: y coordinate of the start point
+        """
+        self.breaks = [0.]  # cumulative arc length at the start of each segment, plus the total length
+        self.x = []  # start point of each segment
+        self.y = []
+        self.heading = []  # direction at the start of each segment in radians
+        self.turn = []  # 0 for straights, +1 for counterclockwise and -1 for clockwise arcs
+        self.radius = []
+        self.angle = []  # reported rotation at the start of each segment in degrees
+        self.angle_rate = []  # change of the reported rotation per degree of arc
+
+        self._x = x
+        self._y = y
+        self._heading = 0.
+
+    @property
+    def total(self) -> float:
+        """
+        @return: total length of the path
+        """
+        return self.breaks[-1]
+
+    def add_straight(self, length, angle=None):
+        """
+        Append a straight in the current direction
+        @param length: length of the straight
+        @param angle: reported rotation along the straight, by default the direction in degrees
+        """
+        self._append(0, 0., length, np.degrees(self._heading) if angle is None else angle, 0)
+        self._x += length*np.cos(self._heading)
+        self._y += length*np.sin(self._heading)
+
+    def add_curve(self, radius, angle, turn, angle_start, angle_rate):
+        """
+        Append a circular arc starting in the current direction
+        @param radius: radius of the arc
+        @param angle: opening angle of the arc in degrees
+        @param turn: +1 for a counterclockwise (left) and -1 for a clockwise (right) arc
+        @param angle_start: reported rotation at the start of the arc
+        @param angle_rate: change of the reported rotation per degree of arc
+        """
+        self._append(turn, radius, np.pi/180*radius*angle, angle_start, angle_rate)
+        phi = np.radians(angle)
+        self._x += turn*radius*(np.sin(self._heading+turn*phi)-np.sin(self._heading))
+        self._y += turn*radius*(np.cos(self._heading)-np.cos(self._heading+turn*phi))
+        self._heading += turn*phi
+
+    def compile(self) -> ResonatorPath:
+        """
+        Convert the segment lists into read-only arrays for the vectorized evaluation
+        @return: the path itself
+        """
+        # segment start points with the rounding of the former integer transformations, see evaluate_snapped
+        for name, coordinates in (("x_snapped", self.x + [self._x]), ("y_snapped", self.y + [self._y])):
+            steps = np.diff(coordinates)
+            steps[1:] = _snap(steps[1:])
+            setattr(self, name, _snap(coordinates[0]) + np.concatenate([[0.], np.cumsum(steps)[:-1]]))
+
+        for name in ("breaks", "x", "y", "heading", "turn", "radius", "angle", "angle_rate", "x_snapped", "y_snapped"):
+            array = np.asarray(getattr(self, name), dtype=float)
+            array.flags.writeable = False
+            setattr(self, name, array)
+        return self
+
+    def evaluate(self, s) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Evaluate the path at given arc lengths. Arc lengths beyond the end extrapolate the last segment
+        @param s: array of arc lengths
+        @return: arrays of x, y and reported rotation in degrees
+        """
+        i, local, phi = self._locate(s)
+        heading = self.heading[i]
+        turn = self.turn[i]
+        radius = self.radius[i]
+
+        curve = turn != 0
+        dx = np.where(curve, turn*radius*(np.sin(heading+turn*phi)-np.sin(heading)), local*np.cos(heading))
+        dy = np.where(curve, turn*radius*(np.cos(heading)-np.cos(heading+turn*phi)), local*np.sin(heading))
+
+        return self.x[i]+dx, self.y[i]+dy, self.angle[i]+self.angle_rate[i]*np.degrees(phi)
+
+    def evaluate_snapped(self, s) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Evaluate the path like evaluate, but with the rounding of the former decorator placement, which moved along the
+        path with integer transformations: the start point and the displacement of every segment after the first one
+        (the coupling straight) are rounded to whole µm
+        @param s: array of arc lengths
+        @return: arrays of x, y and reported rotation in degrees
+        """
+        x, y, angle = self.evaluate(s)
+        i, _, _ = self._locate(s)
+        dx, dy = x - self.x[i], y - self.y[i]
+        dx, dy = np.where(i > 0, _snap(dx), dx), np.where(i > 0, _snap(dy), dy)
+        return self.x_snapped[i]+dx, self.y_snapped[i]+dy, angle
+
+    def direction(self, s) -> np.ndarray:
+        """
+        Direction of the path at given arc lengths
+        @param s: array of arc lengths
+        @return: array of directions in degrees
+        """
+        i, _, phi = self._locate(s)
+        return np.degrees(self.heading[i]+self.turn[i]*phi)
+
+    def centerline(self, length, resolution, chord_error=0, offset=0) -> (np.ndarray, np.ndarray):
+        """
+        Sample the path up to a given length. Straights contribute their start point, arcs are sampled with the given
+        resolution as in create_curve
+        @param length: arc length of the last point
+        @param resolution: amount of points per arc
+        @param chord_error: if > 0, the amount of points per arc is chosen from this maximum chord error instead
+        @param offset: largest distance of a contour from the centerline, used for the chord error
+        @return: arrays of x and y
+        """
+        s = []
+        for i in range(len(self.x)):
+            if self.breaks[i] >= length or self.breaks[i+1] == self.breaks[i]:
+                continue
+            if self.turn[i] == 0:
+                s.append(self.breaks[i:i+1])
+            else:
+                end = min(self.breaks[i+1], length)
+                res = resolution if chord_error <= 0 else \
+                    arc_resolution(self.radius[i]+offset, np.degrees((end-self.breaks[i])/self.radius[i]), chord_error)
+                s.append(np.linspace(self.breaks[i], end, res)[:-1])
+        s.append(np.asarray([length], dtype=float))
+
+        x, y, _ = self.evaluate(np.concatenate(s))
+        return x, y
+
+    def _locate(self, s) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Find the segments of given arc lengths with a binary search
+        @param s: array of arc lengths
+        @return: arrays of segment indices, lengths along the segment and arc angles in radians (0 for straights)
+        """
+        s = np.asarray(s, dtype=float)
+        i = np.clip(np.searchsorted(self.breaks, s, side='right') - 1, 0, len(self.x) - 1)
+        local = s - self.breaks[i]
+        curve = self.turn[i] != 0
+        phi = np.where(curve, local/np.where(curve, self.radius[i], 1), 0)
+        return i, local, phi
+
+    def _append(self, turn, radius, length, angle, angle_rate):
+        self.x.append(self._x)
+        self.y.append(self._y)
+        self.heading.append(self._heading)
+        self.turn.append(turn)
+        self.radius.append(radius)
+        self.angle.append(angle)
+        self.angle_rate.append(angle_rate)
+        self.breaks.append(self.breaks[-1]+length)
+
+
+def _snap(value):
+    """
+    Round to whole µm like KLayout's integer transformations, i.e. half away from zero
+    @param value: value or array
+    @return: rounded value or array
+    """
+    value = np.asarray(value, dtype=float)
+    return np.where(value >= 0, np.floor(value + 0.5), np.ceil(value - 0.5))
 
-    # begin meandering loop
 
+@lru_cache(maxsize=256)
+def resonator_path(segment_length, length, x_offset, y_offset, coupling_length, coupling_ground, radius, width_tl,
+                   gap_tl, width, gap) -> ResonatorPath:
+    """
+    Compile the centerline of a hanging resonator, starting at the open end of the coupling section. The path is shared
+    by the geometry generation (create_res) and the decorator placement (get_coords)
+    @return: path with at least the given length
+    """
+    if np.pi*radius+segment_length <= 0:
+        raise ValueError("Radius and segment length of the resonator must not both be zero")
+
+    # end -> coupling -> rotation -> y_off -> rotation -> x_off -> segment -> rotation -> ...
+    path = ResonatorPath(-segment_length/2+x_offset-coupling_length, width/2+width_tl/2+gap+gap_tl+coupling_ground)
+    path.add_straight(coupling_length, 0)
+    path.add_curve(radius, 90, 1, 0, 1)
+    path.add_straight(y_offset, 90)
+    path.add_curve(radius, 90, 1, 90, 1)
+    path.add_straight(x_offset or segment_length, 180)
+
+    # begin meandering loop
     right = True
+    while path.total <= length:
+        path.add_curve(radius, 180, -1 if right else 1, 180 if right else 360, -1 if right else 1)
+        if path.total > length:
+            break
+        path.add_straight(segment_length, 0)
+        right = not right
 
-    while True:
-        if length < np.pi/180*radius*180:
-            end_angle = 180*length/np.pi/radius
-            curr = create_curve(obj, curr, 180+rotation if right is True else rotation, radius, end_angle, right, width, gap, ground, hole, resolution)
-            create_end(obj, curr, 180-end_angle+rotation if right else 360+end_angle+rotation, shorted, width, gap, ground, hole)
-            return
-        curr = create_curve(obj, curr, 180+rotation if right is True else rotation, radius, 180, right, width, gap, ground, hole, resolution)
-        length -= np.pi/180*radius*180
+    return path.compile()
 
-        if length < segment_length:
-            curr = create_straight(obj, curr, rotation if right is True else 180+rotation, length, width, gap, ground, hole)
-            create_end(obj, curr, rotation if right else 180+rotation, shorted, width, gap, ground, hole)
-            return
 
-        curr = create_straight(obj, curr, rotation if right is True else 180+rotation, segment_length, width, gap, ground, hole)
-        length -= segment_length
+def get_coords(z, start, rotation, params: Cells.Resonator) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Get the coordinates for an array of progress values (in percent, i.e. from 0 to 1) in one vectorized call. The
+    positions are rounded along the path as by the former scalar implementation (see ResonatorPath.evaluate_snapped)
+    @param z: array of progress values along the resonator, between 0 (start) and 1 (end)
+    @param start: start position
+    @param rotation: start rotation
+    @param params: params for the hanging resonator
+    @return: arrays of x, y and rotation
+    """
+    path = resonator_path(params.segment_length, params.length, params.x_offset, params.y_offset,
+                          params.coupling_length, params.coupling_ground, params.radius, params.width_tl,
+                          params.gap_tl, params.width, params.gap)
+    x, y, angle = path.evaluate_snapped(np.asarray(z, dtype=float)*params.length)
 
-        right = not right
+    cos, sin = np.cos(np.radians(rotation)), np.sin(np.radians(rotation))
+    return start.x+cos*x-sin*y, start.y+sin*x+cos*y, angle+rotation
 
 
 def get_coord(z, start, rotation, params: Cells.Resonator) -> (float, float, float):
@@ -138,88 +328,5 @@ def get_coord(z, start, rotation, params: Cells.Resonator) -> (float, float, flo
     @param params: params for the hanging resonator
     @return:
     """
-    # end -> coupling -> rotation -> y_off -> rotation -> x_off -> segment -> rotation -> ...
-
-    length = z*params.length
-    segment_length = params.segment_length
-    x_offset = params.x_offset
-    y_offset = params.y_offset
-    coupling_length = params.coupling_length
-    coupling_ground = params.coupling_ground
-    width = params.width
-    width_tl = params.width_tl
-    gap = params.gap
-    gap_tl = params.gap_tl
-    radius = params.radius
-    ground = params.ground
-    hole = params.hole
-
-    curr = pya.DPoint(start.x-segment_length/2+x_offset-coupling_length, start.y+width/2+width_tl/2+gap+gap_tl+coupling_ground)
-    shift = pya.ICplxTrans(1, rotation, False, 0, 0)
-    curr = pya.DPoint(shift*curr)
-
-    # coupling
-    if length < coupling_length:
-        curr = curr + straight_end(length)
-        return (curr.x, curr.y, rotation)
-    curr = curr + straight_end(coupling_length)
-    length -= coupling_length
-
-    # first meander
-    if length < np.pi*radius/2:
-        end_angle = 180*length/np.pi/radius
-        curr = curr + curve_end(radius, end_angle, 0, width, gap, ground, hole)
-        return (curr.x, curr.y, rotation + end_angle)
-
-    curr = curr + curve_end(radius, 90, 0, width, gap, ground, hole)
-    rot = pya.ICplxTrans(1, 90, False, 0, 0)
-    length -= np.pi*radius/2
-
-    # y_offset
-    if length < y_offset:
-        curr = curr + pya.DPoint(rot*straight_end(length))
-        return (curr.x, curr.y, rotation+90)
-
-    curr = curr + pya.DPoint(rot*straight_end(y_offset))
-    length -= y_offset
-
-    # meander to x_offset
-    if length < np.pi*radius/2:
-        end_angle = 180*length/np.pi/radius
-        curr = curr + pya.DPoint(rot*curve_end(radius, end_angle, 0, width, gap, ground, hole))
-        return (curr.x, curr.y, rotation + 90 + end_angle)
-
-    curr = curr + pya.DPoint(rot*curve_end(radius, 90, 0, width, gap, ground, hole))
-    rot = pya.ICplxTrans(1, 90, False, 0, 0)*rot
-    length -= np.pi*radius/2
-
-    # x_offset
-    if length < x_offset:
-        curr = curr + pya.DPoint(rot*straight_end(length))
-        return (curr.x, curr.y, rotation + 180)
-
-    curr = curr + pya.DPoint(rot*straight_end(x_offset))
-    length -= x_offset
-
-    # begin meandering loop
-
-    right = True
-
-    while True:
-        if length < np.pi/180*radius*180:
-            end_angle = 180*length/np.pi/radius
-            curr = curr + pya.DPoint(rot*curve_end(radius, end_angle, right, width, gap, ground, hole))
-            return (curr.x, curr.y, 180-end_angle+rotation if right else 360+end_angle+rotation)
-
-        curr = curr + pya.DPoint(rot*curve_end(radius, 180, right, width, gap, ground, hole))
-        rot = rot*pya.ICplxTrans(1, 180, False, 0, 0)
-        length -= np.pi/180*radius*180
-
-        if length < segment_length:
-            curr = curr + pya.DPoint(rot*straight_end(length))
-            return (curr.x, curr.y, rotation)
-
-        curr = curr + pya.DPoint(rot*straight_end(segment_length))
-        length -= segment_length
-
-        right = not right
+    x, y, angle = get_coords([z], start, rotation, params)
+    return (float(x[0]), float(y[0]), float(angle[0]))
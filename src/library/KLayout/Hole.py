@@ -18,6 +18,7 @@ class Hole(pya.PCellDeclarationHelper):
         self.param("spacing", self.TypeDouble, "hole spacing", default=50)
         self.param("sigma", self.TypeDouble, "random sigma", default=0)
         self.param("size", self.TypeDouble, "hole size", default=5)
+        self.param("seed", self.TypeInt, "random seed (-1 for a random seed)", default=-1)
 
     def display_text_impl(self):
         # Provide a descriptive text for the cell
@@ -41,17 +42,64 @@ class Hole(pya.PCellDeclarationHelper):
         nx = int(width / spacing)
         ny = int(height / spacing)
 
-        for x in range(0, nx):
-            x += 1/2
-            for y in range(0, ny):
-                y += 1/2
+        x0 = spacing/2 - width/2
+        y0 = spacing/2 - height/2
 
-                if sigma != 0:
-                    rx = sigma*(2*np.random.random()-1)
-                    ry = sigma*(2*np.random.random()-1)
-                else:
-                    rx = 0
-                    ry = 0
-                shift = pya.ICplxTrans(1, 0, False, (x*spacing+rx)-width/2, (y*spacing+ry)-height/2)
-                self.cell.shapes(self.lay_layer).insert(pya.Box(-size/2, -size/2, size/2, size/2).transformed(shift))
+        if sigma == 0:
+            # regular lattice: the hole cell is created once per layout and instantiated as an array
+            box = pya.Box(-size/2, -size/2, size/2, size/2)
+            name = f"HOLE_{self.lay.layer}_{self.lay.datatype}_{box.width()}"
+            hole = self.layout.cell(name)
+            if hole is None:
+                hole = self.layout.create_cell(name)
+                hole.shapes(self.lay_layer).insert(box)
+            self.cell.insert(pya.CellInstArray(hole.cell_index(), pya.Trans(pya.Vector(round(x0), round(y0))),
+                                               pya.Vector(round(spacing), 0), pya.Vector(0, round(spacing)), nx, ny))
+            return
 
+        rng = np.random.default_rng(None if self.seed < 0 else self.seed)
+
+        x, y = np.meshgrid(np.arange(nx)*spacing + x0, np.arange(ny)*spacing + y0, indexing='ij')
+        x = np.round(x.ravel() + sigma*(2*rng.random(nx*ny)-1))
+        y = np.round(y.ravel() + sigma*(2*rng.random(nx*ny)-1))
+
+        boxes = np.stack([x - size/2, y - size/2, x + size/2, y + size/2], axis=1).round().astype(np.int64)
+        self.cell.shapes(self.lay_layer).insert(_box_region(boxes, dbu))
+
+
+def _box_region(boxes: np.ndarray, dbu: float) -> pya.Region:
+    """
+    Build a region of many boxes in bulk: the boxes are written as a GDS stream with NumPy and parsed by KLayout, which
+    avoids creating a Python object per box
+    @param boxes: integer array of shape (n, 4) with left, bottom, right, top of each box in database units
+    @param dbu: database unit of the target layout in µm
+    @return: region of the boxes
+    """
+    def record(kind, payload=b""):
+        return np.array([4 + len(payload), kind], dtype='>i2').tobytes() + payload
+
+    def real8(value):
+        # GDS excess-64 floating point number
+        exponent = int(np.floor(np.log(value)/np.log(16))) + 1
+        return bytes([exponent + 64]) + int(value/16.**exponent*2**56).to_bytes(7, 'big')
+
+    # one BOUNDARY element per box on layer 0/0: BOUNDARY, LAYER, DATATYPE, XY (closed outline), ENDEL
+    elements = np.zeros(len(boxes), dtype=[('boundary', '>i2', 2), ('layer', '>i2', 3), ('datatype', '>i2', 3),
+                                            ('xy_header', '>i2', 2), ('xy', '>i4', 10), ('end', '>i2', 2)])
+    elements['boundary'] = (4, 0x0800)
+    elements['layer'] = (6, 0x0D02, 0)
+    elements['datatype'] = (6, 0x0E02, 0)
+    elements['xy_header'] = (44, 0x1003)
+    left, bottom, right, top = boxes.T
+    elements['xy'] = np.stack([left, bottom, right, bottom, right, top, left, top, left, bottom], axis=1)
+    elements['end'] = (4, 0x1100)
+
+    # HEADER, BGNLIB, LIBNAME, UNITS, BGNSTR, STRNAME ... ENDSTR, ENDLIB
+    dates = np.zeros(12, dtype='>i2').tobytes()
+    stream = (record(0x0002, np.array([600], dtype='>i2').tobytes()) + record(0x0102, dates) +
+              record(0x0206, b"HOLES\0") + record(0x0305, real8(dbu) + real8(dbu*1e-6)) + record(0x0502, dates) +
+              record(0x0606, b"HOLE") + elements.tobytes() + record(0x0700) + record(0x0400))
+
+    layout = pya.Layout()
+    layout.read_bytes(stream)
+    return pya.Region(layout.top_cell().shapes(layout.layer(pya.LayerInfo(0, 0))))
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import klayout.db as pya
 import numpy as np
 import scipy as sc
@@ -22,6 +24,7 @@ class Port(pya.PCellDeclarationHelper):
         self.param("ground", self.TypeDouble, "ground", default=50)
         self.param("hole", self.TypeDouble, "hole mask", default=40)
         self.param("resolution", self.TypeInt, "taper resolution", default=50)
+        self.param("chord_error", self.TypeDouble, "max. chord error in dbu (0: fixed resolution)", default=0)
 
     def display_text_impl(self):
         # Provide a descriptive text for the cell
@@ -43,12 +46,13 @@ class Port(pya.PCellDeclarationHelper):
         ground = self.ground / dbu
         hole = self.hole / dbu
         resolution = self.resolution
+        chord_error = self.chord_error
         # create shape
 
-        create_smooth_port(self, pya.DPoint(0, 0), length_taper, length_port, width_port, spacing, width_cpw, gap_cpw, ground, hole, resolution)
+        create_smooth_port(self, pya.DPoint(0, 0), length_taper, length_port, width_port, spacing, width_cpw, gap_cpw, ground, hole, resolution, chord_error)
 
 
-def create_smooth_port(obj, start, length_taper, length_port, width_port, spacing, width_cpw, gap_cpw, ground, hole, resolution):
+def create_smooth_port(obj, start, length_taper, length_port, width_port, spacing, width_cpw, gap_cpw, ground, hole, resolution, chord_error=0):
     """
     Main method for creating the port - contains the geometry
     @param length_taper: taper length
@@ -58,63 +62,44 @@ def create_smooth_port(obj, start, length_taper, length_port, width_port, spacin
     @param gap_cpw: gap of the CPW
     @param ground: ground size (area without holes)
     @param hole: high density hole mask
+    @param resolution: amount of points along the taper
+    @param chord_error: if > 0, the amount of points along the taper is chosen from this maximum chord error instead
     """
     dbu = obj.layout.dbu
-    gap_list = []
-    mask_list = []
-    hole_list = []
 
-    get_gap = np.polynomial.Polynomial(fixed_point_poly(np.array([width_cpw * dbu]), np.array([gap_cpw * dbu])))
+    get_gap = gap_polynomial(width_cpw * dbu, gap_cpw * dbu)
 
     gap_max = get_gap(width_port*dbu) / dbu
 
-    hole_list.append(pya.DPoint(0, width_port/2+gap_max+ground+hole))
-    mask_list.append(pya.DPoint(hole, width_port/2+gap_max+ground))
-    gap_list.append(pya.DPoint(hole+ground, width_port/2+gap_max))
-
     x_offset = hole + ground + gap_max + length_port
 
-    res = resolution  # 50
-
-    for z in np.linspace(0, 1, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_gap(2*h_w*dbu) / dbu
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground + hole))
-        mask_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g))
-
-    for z in np.linspace(1, 0, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_gap(2*h_w*dbu) / dbu
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, h_w + h_g + ground))
-        mask_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, h_w))
-
-    hole_list.append(pya.DPoint(hole, width_port/2+gap_max+ground))
-    mask_list.append(pya.DPoint(hole, -(width_port/2+gap_max+ground)))
-    gap_list.append(pya.DPoint(hole+ground+gap_max, width_port/2))
-
-    hole_list.append(pya.DPoint(hole, -(width_port/2+gap_max+ground)))
-    gap_list.append(pya.DPoint(hole+ground+gap_max, -width_port/2))
-
-    for z in np.linspace(0, 1, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_gap(2*h_w*dbu) / dbu
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, -h_w))
-
-    for z in np.linspace(1, 0, res):
-        h_w = get_height(z)*(width_port-width_cpw)/2+width_cpw/2
-        h_g = get_gap(2*h_w*dbu) / dbu
-
-        hole_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g + ground + hole)))
-        gap_list.append(pya.DPoint(x_offset + z * length_taper, -(h_w + h_g)))
-
-    hole_list.append(pya.DPoint(0, -(width_port/2+gap_max+ground+hole)))
-    gap_list.append(pya.DPoint(hole+ground, -(width_port/2+gap_max)))
+    res = resolution if chord_error <= 0 else \
+        taper_resolution(length_taper, width_port, width_cpw, get_gap, dbu, chord_error)  # 50
+
+    # whole taper profile at once, the contours go along the taper (forward) and back (reversed)
+    z, height = unit_taper(res)
+    x = x_offset + z * length_taper
+    h_w = height*(width_port-width_cpw)/2+width_cpw/2
+    h_g = get_gap(2*h_w*dbu) / dbu
+
+    hole_list = contour([0], [width_port/2+gap_max+ground+hole],
+                        x, h_w + h_g + ground + hole,
+                        x[::-1], (h_w + h_g + ground)[::-1],
+                        [hole, hole], [width_port/2+gap_max+ground, -(width_port/2+gap_max+ground)],
+                        x, -(h_w + h_g + ground),
+                        x[::-1], -(h_w + h_g + ground + hole)[::-1],
+                        [0], [-(width_port/2+gap_max+ground+hole)])
+    mask_list = contour([hole], [width_port/2+gap_max+ground],
+                        x, h_w + h_g + ground,
+                        x[::-1], -(h_w + h_g + ground)[::-1],
+                        [hole], [-(width_port/2+gap_max+ground)])
+    gap_list = contour([hole+ground], [width_port/2+gap_max],
+                       x, h_w + h_g,
+                       x[::-1], h_w[::-1],
+                       [hole+ground+gap_max, hole+ground+gap_max], [width_port/2, -width_port/2],
+                       x, -h_w,
+                       x[::-1], -(h_w + h_g)[::-1],
+                       [hole+ground], [-(width_port/2+gap_max)])
 
     shift = pya.ICplxTrans(1, 0, False, start.x+spacing, start.y)
 
@@ -128,16 +113,59 @@ def create_smooth_port(obj, start, length_taper, length_port, width_port, spacin
 
     return shift*pya.DPoint(length_taper+length_port+gap_max+ground+hole, 0)
 
+
+def taper_resolution(length_taper, width_port, width_cpw, get_gap, dbu, chord_error) -> int:
+    """
+    Amount of points along the taper, such that the chords of the outer contour deviate at most by the chord error.
+    The deviation of a chord of length h is bounded by h^2/8 times the maximum curvature of the contour
+    @param length_taper: taper length
+    @param width_port: width of the port
+    @param width_cpw: width of the CPW
+    @param get_gap: gap polynomial (in um)
+    @param dbu: database unit
+    @param chord_error: maximum chord error
+    @return: amount of points, at least 2
+    """
+    z, height = unit_taper(1001)
+    x = z*length_taper
+    h_w = height*(width_port-width_cpw)/2+width_cpw/2
+    contour_height = h_w + get_gap(2*h_w*dbu) / dbu
+    curvature = np.max(np.abs(np.gradient(np.gradient(contour_height, x), x)))
+    return max(2, int(np.ceil(length_taper*np.sqrt(curvature/(8*chord_error))))+1)
+
+
+def contour(*coordinates) -> [pya.DPoint]:
+    """
+    Join pieces of a contour into a point list
+    @param coordinates: alternating x and y coordinates (scalars in lists or arrays) of the pieces
+    @return: list of points
+    """
+    x = np.concatenate(coordinates[::2])
+    y = np.concatenate(coordinates[1::2])
+    return [pya.DPoint(x_i, y_i) for x_i, y_i in zip(x.tolist(), y.tolist())]
+
+
+@lru_cache(maxsize=256)
+def unit_taper(resolution) -> (np.ndarray, np.ndarray):
+    """
+    Normalized taper profile, shared by Port and CustomPort
+    @param resolution: amount of points
+    @return: read-only arrays of the positions z from 0 to 1 and the heights from 1 to 0
+    """
+    z = np.linspace(0, 1, resolution)
+    height = get_height(z)
+    z.flags.writeable = False
+    height.flags.writeable = False
+    return z, height
+
+
 def get_height(z):
     """
     Calculates the height to a corresponding x value
-    @param z: x coordinate normalized between 0 and 1
+    @param z: x coordinate normalized between 0 and 1, scalar or array
     @return: the height normalized between 0 and 1. Returns 1 for z=0 and 0 for z=1
     """
-    if z < 0:
-        return 1
-    if z > 1:
-        return 0
+    z = np.clip(z, 0, 1)
     return 2*z**3-3*z**2+1
 
 
@@ -151,8 +179,30 @@ def max_port_gap(width_port, width_cpw, gap_cpw):
     @param gap_cpw: gap of the CPW
     @return:
     """
-    get_gap = np.polynomial.Polynomial(fixed_point_poly(np.array([width_cpw]), np.array([gap_cpw])))
-    return get_gap(width_port)
+    return gap_polynomial(width_cpw, gap_cpw)(width_port)
+
+
+def gap_polynomial(width_cpw, gap_cpw) -> np.polynomial.Polynomial:
+    """
+    Gap as a function of the width, fitted once per CPW geometry. See fixed_point_poly
+    @param width_cpw: width of the CPW
+    @param gap_cpw: gap of the CPW
+    @return: polynomial for the gap, a new object for each call
+    """
+    return np.polynomial.Polynomial(gap_coefficients(width_cpw, gap_cpw))
+
+
+@lru_cache(maxsize=256)
+def gap_coefficients(width_cpw, gap_cpw) -> np.ndarray:
+    """
+    Cached coefficients of gap_polynomial
+    @param width_cpw: width of the CPW
+    @param gap_cpw: gap of the CPW
+    @return: read-only array of the polynomial coefficients
+    """
+    coefficients = fixed_point_poly(np.array([width_cpw]), np.array([gap_cpw]))
+    coefficients.flags.writeable = False
+    return coefficients
 
 
 def fixed_point_poly(xf, yf):
@@ -167,6 +217,10 @@ def fixed_point_poly(xf, yf):
     # assuming ground beneath
     x = np.array([0, 20, 40, 60, 80, 100, 120, 140, 160, 180, 200, 220, 240, 260, 280, 300])
     y = np.array([0, 12, 23, 35, 47, 59, 72, 86, 100, 116, 133, 152, 172, 196, 223, 250])
+    # fit in x/scale, otherwise the powers up to x^6 make the system ill-conditioned
+    scale = x.max()
+    x = x / scale
+    xf = xf / scale
     mat = np.empty((n + 1 + len(xf),) * 2)
     vec = np.empty((n + 1 + len(xf),))
     x_n = x**np.arange(2 * n + 1)[:, None]
@@ -182,7 +236,7 @@ def fixed_point_poly(xf, yf):
     vec[n + 1:] = yf
     # params = np.linalg.solve(mat, vec)
     params = sc.linalg.solve(mat, vec)
-    return params[:n + 1]
+    return params[:n + 1] / scale**np.arange(n + 1)
 
 
 def end_point(length_taper, length_port, width_port, spacing, width_cpw, gap_cpw, ground, hole):
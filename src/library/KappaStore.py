@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+from pathlib import Path
+
+"""
+Persistent store for the TL-resonator coupling coefficients kappa. The values are kept in an SQLite database at the
+repository root, so that the store is independent of the current working directory and can be shared safely between
+parallel builds. Keys are geometry tuples (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff). Kappa
+does not depend on eps_eff, so all keys are stored with the reference value
+"""
+
+store_path = Path(__file__).resolve().parents[2] / "kappaValues.db"  # location of the kappa database
+legacy_path = Path(__file__).resolve().parents[2] / "kappaValues.txt"  # pickle file of former versions, migrated once
+timeout = 30  # seconds to wait for a concurrent writer to release the database lock
+reference_eps_eff = 6.45  # eps_eff of all stored keys, as kappa is independent of eps_eff
+
+_columns = ("width_cpw", "gap_cpw", "width_res", "gap_res", "coupling_ground", "eps_eff")
+_connection = None
+_connection_pid = None
+
+
+def lookup(key) -> float | None:
+    """
+    Look up a kappa value
+    @param key: geometry tuple (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+    @return: the stored kappa value or None, if the key is not in the store
+    """
+    condition = " AND ".join(f"{column} = ?" for column in _columns)
+    row = _connect().execute(f"SELECT kappa FROM kappa WHERE {condition}", _normalize(key)).fetchone()
+    return None if row is None else row[0]
+
+
+def store(key, kappa: float):
+    """
+    Store a single kappa value
+    @param key: geometry tuple (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+    @param kappa: coupling coefficient
+    """
+    store_many([(key, kappa)])
+
+
+def store_many(items):
+    """
+    Store several kappa values within one transaction
+    @param items: iterable of (key, kappa) pairs
+    """
+    rows = [(*_normalize(key), float(kappa)) for key, kappa in items]
+    connection = _connect()
+    with connection:
+        connection.executemany(f"INSERT OR REPLACE INTO kappa ({', '.join(_columns)}, kappa) "
+                               f"VALUES ({', '.join('?' * (len(_columns) + 1))})", rows)
+
+
+def keys() -> set:
+    """
+    All keys in the store
+    @return: set of geometry tuples
+    """
+    return {tuple(row) for row in _connect().execute(f"SELECT {', '.join(_columns)} FROM kappa")}
+
+
+def _normalize(key) -> tuple:
+    """
+    Convert a geometry tuple into plain floats, so that e.g. 10 and 10.0 refer to the same entry, and replace eps_eff by
+    the reference value
+    @param key: geometry tuple
+    @return: normalized tuple
+    """
+    if len(key) != len(_columns):
+        raise ValueError(f"Expected a key of {len(_columns)} values {_columns}, got {key}")
+    return (*(float(value) for value in key[:-1]), reference_eps_eff)
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Connection to the database, opened once per process. Creates the database and migrates the legacy pickle file if
+    needed
+    @return: the connection
+    """
+    global _connection, _connection_pid
+
+    if _connection is None or _connection_pid != os.getpid():
+        _connection = sqlite3.connect(store_path, timeout=timeout)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        with _connection:
+            _connection.execute(f"CREATE TABLE IF NOT EXISTS kappa ({' REAL NOT NULL, '.join(_columns)} REAL NOT NULL, "
+                                f"kappa REAL NOT NULL, PRIMARY KEY ({', '.join(_columns)}))")
+        _connection_pid = os.getpid()
+
+        if _connection.execute("SELECT COUNT(*) FROM kappa").fetchone()[0] == 0:
+            _migrate()
+
+    return _connection
+
+
+def _migrate():
+    """
+    Fill an empty store with the values of the legacy pickle file, or with the default value if there is none
+    """
+    kappa_dict = {(10, 6, 10, 6, 3, 6.45): 0.11358238085799895}
+    if legacy_path.exists():
+        print(f"Migrating kappa values from {legacy_path}...")
+        with open(legacy_path, 'rb') as handle:
+            kappa_dict.update(pickle.loads(handle.read()))
+
+    rows = [(*_normalize(key), float(kappa)) for key, kappa in kappa_dict.items()]
+    with _connection:
+        # INSERT OR IGNORE, as a concurrent process might migrate at the same time
+        _connection.executemany(f"INSERT OR IGNORE INTO kappa ({', '.join(_columns)}, kappa) "
+                                f"VALUES ({', '.join('?' * (len(_columns) + 1))})", rows)
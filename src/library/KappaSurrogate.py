@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+import src.library.KappaStore as KappaStore
+
+"""
+Tabulated surrogate model for the TL-resonator coupling coefficient kappa. The surrogate is built offline on a regular
+grid over (width_cpw, gap_cpw, width_res, gap_res, coupling_ground) and interpolated linearly. Each grid node carries an
+error estimate of the linear interpolation, so that lookups with an estimated error above the tolerance fall back to
+the exact solver. As in the kappa store, kappa is treated as independent of eps_eff, so the surrogate answers keys with
+any eps_eff
+"""
+
+surrogate_path = Path(__file__).resolve().parents[2] / "kappaSurrogate.npz"  # location of the tabulated grid
+tolerance = 1e-3  # maximum estimated relative interpolation error for answering from the surrogate
+
+_axis_names = ("width_cpw", "gap_cpw", "width_res", "gap_res", "coupling_ground")
+_surrogate = None
+_surrogate_mtime = None
+
+
+def lookup(key) -> float | None:
+    """
+    Interpolate kappa from the surrogate grid
+    @param key: geometry tuple (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+    @return: interpolated kappa, or None if there is no surrogate, the key is outside the grid or the estimated error
+             exceeds the tolerance
+    """
+    surrogate = _load()
+    if surrogate is None:
+        return None
+
+    point = np.asarray(key[:-1], dtype=float)  # eps_eff is ignored, see KappaStore
+
+    # axes with a single grid value are not interpolated and have to match exactly
+    fixed = surrogate["fixed"]
+    if not np.allclose(point[fixed], surrogate["fixed_values"]):
+        return None
+    point = point[~fixed]
+    if np.any(point < surrogate["lower"]) or np.any(point > surrogate["upper"]):
+        return None
+
+    kappa = float(surrogate["kappa"](point)[0])
+    if surrogate["error"](point)[0] > tolerance * abs(kappa):
+        return None
+
+    return kappa
+
+
+def build_surrogate(width_cpw, gap_cpw, width_res, gap_res, coupling_ground, workers=None):
+    """
+    Tabulate kappa on a regular grid and save the surrogate. The grid values are taken from the kappa store, missing
+    values are solved exactly in parallel and stored as well
+    @param width_cpw: grid values for the width of the TL
+    @param gap_cpw: grid values for the gap of the TL
+    @param width_res: grid values for the width of the resonator
+    @param gap_res: grid values for the gap of the resonator
+    @param coupling_ground: grid values for the ground between TL and resonator
+    @param workers: number of worker processes for missing values, None for the number of CPUs
+    """
+    axes = [np.unique(np.asarray(axis, dtype=float)) for axis in
+            (width_cpw, gap_cpw, width_res, gap_res, coupling_ground)]
+    if all(len(axis) == 1 for axis in axes):
+        raise ValueError("The surrogate grid needs at least one axis with more than one value")
+    keys = [(*node, KappaStore.reference_eps_eff) for node in itertools.product(*axes)]
+
+    print(f"Tabulating {len(keys)} kappa values...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        values = list(executor.map(_calc_kappa, keys, chunksize=max(1, len(keys) // (4 * (workers or os.cpu_count())))))
+
+    kappa = np.asarray(values).reshape([len(axis) for axis in axes])
+    np.savez(surrogate_path, kappa=kappa, error=_error_estimate(kappa),
+             **{name: axis for name, axis in zip(_axis_names, axes)})
+    print(f"Saved kappa surrogate to {surrogate_path}")
+
+
+def _error_estimate(kappa: np.ndarray) -> np.ndarray:
+    """
+    Estimate the error of the linear interpolation at each grid node. Along each axis the error is bounded by
+    h^2/8 * |f''|, i.e. an eighth of the absolute second difference. The errors of all axes are added up
+    @param kappa: tabulated values
+    @return: error estimate with the shape of the grid
+    """
+    error = np.zeros_like(kappa)
+    for axis in range(kappa.ndim):
+        if kappa.shape[axis] < 3:
+            continue
+        second = np.abs(np.diff(kappa, n=2, axis=axis)) / 8
+        # the second difference belongs to the inner nodes, the outer nodes take the value of their neighbour
+        second = np.concatenate([np.take(second, [0], axis=axis), second, np.take(second, [-1], axis=axis)], axis=axis)
+        error += second
+    return error
+
+
+def _calc_kappa(key) -> float:
+    """
+    Worker for building the surrogate. Takes the exact value from the kappa store or solves it, but never interpolates
+    from an existing surrogate, so that rebuilding or extending the grid does not tabulate interpolated values
+    @param key: geometry tuple
+    @return: kappa
+    """
+    import src.library.ResonatorUtil as Util
+
+    kappa = KappaStore.lookup(key)
+    if kappa is None:
+        kappa = Util.solve_kappa(*key)
+        KappaStore.store(key, kappa)
+    return kappa
+
+
+def _load() -> dict | None:
+    """
+    Load the surrogate, reloading it if the file has changed
+    @return: dictionary with the interpolators and grid bounds, or None if there is no surrogate
+    """
+    global _surrogate, _surrogate_mtime
+
+    if not surrogate_path.exists():
+        return None
+
+    mtime = surrogate_path.stat().st_mtime
+    if _surrogate is None or mtime != _surrogate_mtime:
+        with np.load(surrogate_path) as data:
+            axes = [data[name] for name in _axis_names]
+            fixed = np.array([len(axis) == 1 for axis in axes])
+            kappa = data["kappa"].reshape([len(axis) for axis in axes if len(axis) > 1])
+            error = data["error"].reshape(kappa.shape)
+            grid = [axis for axis in axes if len(axis) > 1]
+            _surrogate = {
+                "fixed": fixed,
+                "fixed_values": np.array([axis[0] for axis in axes if len(axis) == 1]),
+                "lower": np.array([axis[0] for axis in grid]),
+                "upper": np.array([axis[-1] for axis in grid]),
+                "kappa": RegularGridInterpolator(grid, kappa),
+                "error": RegularGridInterpolator(grid, error),
+            }
+        _surrogate_mtime = mtime
+
+    return _surrogate
+
+# # Example usage:
+# build_surrogate(width_cpw=[10], gap_cpw=[6], width_res=np.arange(6, 16, 1), gap_res=np.arange(4, 10, 1),
+#                 coupling_ground=np.arange(2, 12, 1))
@@ -1,8 +1,13 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 import numpy as np
 import scipy.special as sp
 import src.library.coplanar_coupler as coupler
-import os
-import pickle
+import src.library.KappaStore as KappaStore
+import src.library.KappaSurrogate as KappaSurrogate
 
 """
 File containing resonator utility methods, e.g. kinetic inductance, TL couplings and resonator lengths
@@ -117,30 +122,113 @@ def calc_coupling_length(width_cpw, gap_cpw, width_res, gap_res, coupling_ground
     :@param intended_q: external Q one wishes to achieve
     :@return: The calculated coupling length
     """
-    key = (width_cpw, gap_cpw, width_res, gap_res,
-           coupling_ground, eps_eff)
+    kappa = calc_kappa(width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+
+    return int((_v_ph(eps_eff) / (2 * np.pi * calc_f0(length, eps_eff) * 1e9) * np.arcsin(
+        np.sqrt(np.pi / (2 * kappa ** 2 * q_ext)))) * 1e9)
 
-    kappa_dict = _load_kappa_dict()
 
-    if key in kappa_dict:
-        kappa = kappa_dict[key]
-    else:
+@lru_cache(maxsize=1024)
+def calc_kappa(width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff) -> float:
+    """
+    Coupling coefficient between TL and resonator. Looks up the persistent kappa store first, then interpolates the
+    kappa surrogate and solves the conformal mapping problem only if neither can answer
+    @param width_cpw: width of the TL
+    @param gap_cpw: gap of the TL
+    @param width_res: width of the resonator
+    @param gap_res: gap of the resonator
+    @param coupling_ground: width of the ground between TL and resonator
+    @param eps_eff: effective permittivity
+    @return: kappa
+    """
+    key = (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+
+    kappa = _lookup_kappa(key)
+    if kappa is None:
         print("No value for kappa detected. Calculating new value for determining Q_ext...")
-        cpw_c = coupler.coplanar_coupler()
-        cpw_c.w1 = width_cpw
-        cpw_c.s1 = gap_cpw
-        cpw_c.w2 = width_res
-        cpw_c.s2 = gap_res
-        cpw_c.w3 = coupling_ground
-        cpw_c.epsilon_eff = 6.45
-        Cl, Ll, Zl = cpw_c.coupling_matrices(mode='notch')
-        kappa = Zl[0, 1] / (np.sqrt(Zl[0, 0] * Zl[1, 1]))
-
-        kappa_dict[key] = kappa
-        _save_kappa_dict(kappa_dict)
+        kappa = solve_kappa(*key)
+        KappaStore.store(key, kappa)
 
-    return int((_v_ph(eps_eff) / (2 * np.pi * calc_f0(length, eps_eff) * 1e9) * np.arcsin(
-        np.sqrt(np.pi / (2 * kappa ** 2 * q_ext)))) * 1e9)
+    return kappa
+
+
+def calc_coupling_lengths(width_cpw, gap_cpw, width_res, gap_res, coupling_ground, length, q_ext, eps_eff,
+                          workers=None) -> np.ndarray:
+    """
+    Batch version of calc_coupling_length. All parameters can be scalars or arrays of the same length, kappa is
+    determined once for each unique geometry
+    @param workers: number of worker processes for solving missing kappa values, None for the number of CPUs
+    @return: array of coupling lengths
+    @raise ValueError: if the external Q of a resonator cannot be reached with its coupling geometry
+    """
+    width_cpw, gap_cpw, width_res, gap_res, coupling_ground, length, q_ext, eps_eff = np.broadcast_arrays(*map(
+        np.atleast_1d, (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, length, q_ext, eps_eff)))
+
+    keys = list(zip(*(a.tolist() for a in (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff))))
+    kappa_dict = calc_kappas(set(keys), workers)
+    kappa = np.array([kappa_dict[key] for key in keys])
+
+    with np.errstate(invalid='ignore'):
+        coupling_length = np.trunc((_v_ph(eps_eff) / (2 * np.pi * calc_f0(length, eps_eff) * 1e9) * np.arcsin(
+            np.sqrt(np.pi / (2 * kappa ** 2 * q_ext)))) * 1e9)
+
+    invalid = np.flatnonzero(~np.isfinite(coupling_length))
+    if len(invalid) > 0:
+        raise ValueError(f"No coupling length for resonator {invalid[0]} (q_ext={q_ext[invalid[0]]}, "
+                         f"kappa={kappa[invalid[0]]}): q_ext too low for the coupling geometry")
+
+    return coupling_length.astype(int)
+
+
+def calc_kappas(keys, workers=None) -> {(float, float, float, float, float, float): float}:
+    """
+    Kappa values for several geometries. Missing values are solved in parallel and stored
+    @param keys: iterable of geometry tuples (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff)
+    @param workers: number of worker processes, None for the number of CPUs
+    @return: dictionary of geometry tuples and kappa values
+    """
+    kappa_dict = {key: _lookup_kappa(key) for key in set(keys)}
+    missing = [key for key, kappa in kappa_dict.items() if kappa is None]
+
+    if len(missing) == 1 or workers == 1:
+        for key in missing:
+            kappa_dict[key] = calc_kappa(*key)
+    elif missing:
+        print(f"No value for kappa detected for {len(missing)} geometries. Calculating new values in parallel...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            solved = list(executor.map(solve_kappa, *zip(*missing)))
+        KappaStore.store_many(zip(missing, solved))
+        kappa_dict.update(zip(missing, solved))
+
+    return kappa_dict
+
+
+def _lookup_kappa(key) -> float | None:
+    """
+    Kappa from the store or the surrogate without solving
+    @param key: geometry tuple
+    @return: kappa or None, if neither can answer
+    """
+    kappa = KappaStore.lookup(key)
+    if kappa is None:
+        kappa = KappaSurrogate.lookup(key)
+    return kappa
+
+
+def solve_kappa(width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff) -> float:
+    """
+    Solve for kappa with the conformal mapping technique of the coplanar coupler
+    @return: kappa
+    """
+    cpw_c = coupler.coplanar_coupler()
+    cpw_c.w1 = width_cpw
+    cpw_c.s1 = gap_cpw
+    cpw_c.w2 = width_res
+    cpw_c.s2 = gap_res
+    cpw_c.w3 = coupling_ground
+    cpw_c.epsilon_eff = eps_eff
+    Cl, Ll, Zl = cpw_c.coupling_matrices(mode='notch')
+    return float(Zl[0, 1] / (np.sqrt(Zl[0, 0] * Zl[1, 1])))
 
 
 def calc_f0(length, eps_eff) -> float:
@@ -168,23 +256,3 @@ def _v_ph(eps_eff) -> float:
     @return: effective phase velocity of light
     """
     return c / np.sqrt(eps_eff)
-
-
-def _load_kappa_dict() -> {(float, float, float, float, float): float}:
-    """
-    Load the kappa dictionary for fast calculation of the Quality factor
-    @return: Dictionary containing the parameters and associated kappa value
-    """
-    if not os.path.exists('../../kappaValues.txt'):
-        _save_kappa_dict({(10, 6, 10, 6, 3, 6.45): 0.11358238085799895})
-    with open('../../kappaValues.txt', 'rb') as handle:
-        return pickle.loads(handle.read())
-
-
-def _save_kappa_dict(kappa_dict):
-    """
-    Save the kappa dictionary into a binary (non-readable) file
-    @param kappa_dict: Dictionary to save
-    """
-    with open('../../kappaValues.txt', 'wb') as handle:
-        pickle.dump(kappa_dict, handle)
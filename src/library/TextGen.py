@@ -1,46 +1,54 @@
 import klayout.db as pya
 
+import src.library.AssetCache as AssetCache
+
 """
 Quick and dirty text generator using the custom font
 """
 
 
-def write_text(layout, text, font="circular_font", buffer_trigger="´") -> pya.Cell:
+class FontAtlas:
     """
-    Write a text with a given font file. Special characters (i.e. cells with names longer than one char) can be written
-    by enclosing the cell name with the buffer trigger, e.g. ´Qext´ or ´epsilon´.
-    @param layout: layout to be used for the cell
-    @param text: text to write
-    @param font: font to be used, currently only "circular_font" exists
-    @param buffer_trigger: trigger for the buffer, should be a character without any practical use
-    @return: a cell object
+    Glyphs of a font, loaded once with precomputed advance widths. Texts are laid out as instances of
+    glyph cells, which are copied once into each target layout and shared by all texts of that layout
     """
-    # auxilliary layout for font loading
-    aux = pya.Layout()
-    dbu = aux.dbu
-
-    lines = text.splitlines()
-    aux.read(f"../../templates/{font}.gds")
-    text = aux.create_cell("text")
-
-    letter_spacing = 5
-    height = aux.cell("0").bbox().height()*dbu
-
-    x, y = 0, height*(len(lines)-1)
-
-    for line in lines:
-
-        text.shapes(aux.layer(2, 0)).insert(pya.Box(-3*letter_spacing/dbu, y/dbu, 0, y/dbu+height/dbu))
 
+    def __init__(self, font="circular_font", buffer_trigger="´", letter_spacing=5):
+        """
+        Load the glyphs of a font
+        @param font: font to be used, currently only "circular_font" exists
+        @param buffer_trigger: trigger for the buffer, should be a character without any practical use
+        @param letter_spacing: spacing between two letters
+        """
+        self.font = font
+        self.buffer_trigger = buffer_trigger
+        self.letter_spacing = letter_spacing
+
+        self.source = AssetCache.get_layout(AssetCache.template_path(font))
+        dbu = self.source.dbu
+
+        self.height = self.source.cell("0").bbox().height()*dbu
+        self.advance = {}  # glyph name -> advance width
+        for cell in self.source.each_cell():
+            self.advance[cell.name] = cell.bbox().width()*dbu
+
+    def glyphs(self, line: str) -> [str]:
+        """
+        Split a line into glyph names. Special characters (i.e. cells with names longer than one char) are written by
+        enclosing the cell name with the buffer trigger, e.g. ´Qext´ or ´epsilon´
+        @param line: line of text
+        @return: list of glyph names
+        """
+        glyphs = []
         buffer = None
 
         for letter in line:
-            if buffer is None and letter == buffer_trigger:
+            if buffer is None and letter == self.buffer_trigger:
                 buffer = ""
                 continue
 
             if buffer is not None:
-                if letter == buffer_trigger:
+                if letter == self.buffer_trigger:
                     letter = buffer
                     buffer = None
                 else:
@@ -49,27 +57,113 @@ def write_text(layout, text, font="circular_font", buffer_trigger="´") -> pya.C
 
             if letter == " ":
                 letter = "space"
-            letter_cell = aux.cell_by_name(letter)
-            trans = pya.DCplxTrans.new(1, 0, False, x, y)
-            text.insert(pya.DCellInstArray(letter_cell, trans))
-
-            x += aux.cell(letter_cell).bbox().width()*dbu
-
-            text.shapes(aux.layer(2, 0)).insert(pya.Box(x/dbu, y/dbu, x/dbu+letter_spacing/dbu, y/dbu+height/dbu))
-
-            x += letter_spacing
-
-        text.shapes(aux.layer(2, 0)).insert(pya.Box(x/dbu, y/dbu, x/dbu+2*letter_spacing/dbu, y/dbu+height/dbu))
-
-        y -= height
-        x = 0
-
-    text.flatten(1)
+            if letter not in self.advance:
+                raise ValueError(f"Glyph '{letter}' does not exist in font '{self.font}'")
+            glyphs.append(letter)
+
+        return glyphs
+
+    def write_text(self, layout, text, name="rtext") -> pya.Cell:
+        """
+        Write a text, lines are separated by line breaks
+        @param layout: layout to be used for the cell
+        @param text: text to write
+        @param name: name of the text cell
+        @return: a cell object
+        """
+        return self.write_many(layout, [text], name)[0]
+
+    def write_many(self, layout, texts, name="rtext") -> [pya.Cell]:
+        """
+        Write several texts in one pass, e.g. the lines of a chip label or the serial numbers of a wafer. All texts share
+        the glyph cells of the layout
+        @param layout: layout to be used for the cells
+        @param texts: list of texts to write
+        @param name: name of the text cells
+        @return: list of cell objects, one per text
+        """
+        glyph_cells = {}
+        spacer_layer = layout.layer(2, 0)
+        spacing = self.letter_spacing
+        height = self.height
+
+        cells = []
+        for text in texts:
+            cell = layout.create_cell(name)
+            lines = text.splitlines()
+            spacers = []
+
+            x, y = 0, height*(len(lines)-1)
+
+            for line in lines:
+                spacers.append(pya.DBox(-3*spacing, y, 0, y+height))
+
+                for glyph in self.glyphs(line):
+                    if glyph not in glyph_cells:
+                        glyph_cells[glyph] = self._glyph_cell(layout, glyph)
+                    cell.insert(pya.DCellInstArray(glyph_cells[glyph], pya.DCplxTrans.new(1, 0, False, x, y)))
+
+                    x += self.advance[glyph]
+                    spacers.append(pya.DBox(x, y, x+spacing, y+height))
+                    x += spacing
+
+                spacers.append(pya.DBox(x, y, x+2*spacing, y+height))
+
+                y -= height
+                x = 0
+
+            region = pya.Region()
+            for spacer in spacers:
+                region.insert(spacer.to_itype(layout.dbu))
+            cell.shapes(spacer_layer).insert(region.merged())
+
+            cells.append(cell)
+
+        return cells
+
+    def _glyph_cell(self, layout, glyph: str) -> int:
+        """
+        Cell of a glyph in the target layout, copied from the font on first use
+        @param layout: target layout
+        @param glyph: glyph name
+        @return: cell index
+        """
+        name = f"{self.font}_{glyph}"
+        cell = layout.cell(name)
+        if cell is None:
+            cell = layout.create_cell(name)
+            cell.copy_tree(self.source.cell(glyph))
+        return cell.cell_index()
+
+
+_atlases = {}  # (font, buffer trigger) -> FontAtlas
+
+
+def get_atlas(font="circular_font", buffer_trigger="´") -> FontAtlas:
+    """
+    Shared atlas of a font, reloaded if the font file has changed
+    @param font: font to be used, currently only "circular_font" exists
+    @param buffer_trigger: trigger for the buffer, should be a character without any practical use
+    @return: the font atlas
+    """
+    atlas = _atlases.get((font, buffer_trigger))
+    if atlas is None or atlas.source is not AssetCache.get_layout(AssetCache.template_path(font)):
+        atlas = FontAtlas(font, buffer_trigger)
+        _atlases[(font, buffer_trigger)] = atlas
+    return atlas
 
-    cell = layout.create_cell("rtext")
-    cell.copy_shapes(text)
 
-    return cell
+def write_text(layout, text, font="circular_font", buffer_trigger="´") -> pya.Cell:
+    """
+    Write a text with a given font file. Special characters (i.e. cells with names longer than one char) can be written
+    by enclosing the cell name with the buffer trigger, e.g. ´Qext´ or ´epsilon´.
+    @param layout: layout to be used for the cell
+    @param text: text to write
+    @param font: font to be used, currently only "circular_font" exists
+    @param buffer_trigger: trigger for the buffer, should be a character without any practical use
+    @return: a cell object
+    """
+    return get_atlas(font, buffer_trigger).write_text(layout, text)
 
 
 def place_cell_center(layout, cell, text, mag, x, y):
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import numpy as np
+
+"""
+Placement of chips on a round wafer with a flat. Chips have to lie completely inside the wafer minus the edge exclusion
+and above the flat. Chips of equal size are placed on a common grid (so that the wafer can be diced by straight cuts),
+whose offset is optimized by a grid search. Chips of mixed sizes are packed into horizontal shelves. All lengths in µm,
+positions are chip centers
+"""
+
+flat_angle = 0.3  # half opening angle of the flat in rad, identical to the wafer outline of WaferBuilder
+
+
+def flat_position(radius: float) -> float:
+    """
+    y coordinate of the flat at the bottom of the wafer
+    @param radius: wafer radius
+    @return: y coordinate
+    """
+    return -radius*np.cos(flat_angle)
+
+
+def chip_mask(x, y, width, height, radius, flat_y=None, edge_exclusion=0.) -> np.ndarray:
+    """
+    Check which chips lie completely inside the usable wafer area
+    @param x: x coordinates of the chip centers
+    @param y: y coordinates of the chip centers
+    @param width: chip width(s)
+    @param height: chip height(s)
+    @param radius: wafer radius
+    @param flat_y: y coordinate of the flat, None for a wafer without flat
+    @param edge_exclusion: width of the unusable ring at the wafer edge (and above the flat)
+    @return: boolean array, True for chips inside the usable area
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    usable = radius - edge_exclusion
+
+    # the corner farthest from the wafer center decides
+    mask = (np.abs(x) + width/2)**2 + (np.abs(y) + height/2)**2 <= usable**2
+    if flat_y is not None:
+        mask &= y - height/2 >= flat_y + edge_exclusion
+    return mask
+
+
+def grid_positions(pitch_x, pitch_y, radius, origin=(0., 0.), width=0., height=0., flat_y=None, edge_exclusion=0.,
+                   bounding_box=None, exclusion_zones=None) -> np.ndarray:
+    """
+    All positions of a regular grid on which a chip fits, built as arrays and filtered in one pass
+    @param pitch_x: x pitch of the grid
+    @param pitch_y: y pitch of the grid
+    @param radius: wafer radius
+    @param origin: one point of the grid, i.e. the grid offset
+    @param width: chip width, 0 for only checking the chip centers
+    @param height: chip height, 0 for only checking the chip centers
+    @param flat_y: y coordinate of the flat, None for a wafer without flat
+    @param edge_exclusion: width of the unusable ring at the wafer edge
+    @param bounding_box: constraint for the chip centers in the format [(ll_x, ll_y), (ur_x, ur_y)], None for none
+    @param exclusion_zones: list of rectangles [(ll_x, ll_y), (ur_x, ur_y)] which the chips must not overlap
+    @return: array of shape (n, 2) with the chip centers, sorted by ascending distance from the wafer center
+    """
+    i = np.arange(np.floor((-radius - origin[0])/pitch_x), np.ceil((radius - origin[0])/pitch_x) + 1)
+    j = np.arange(np.floor((-radius - origin[1])/pitch_y), np.ceil((radius - origin[1])/pitch_y) + 1)
+    x, y = np.meshgrid(origin[0] + i*pitch_x, origin[1] + j*pitch_y, indexing='ij')
+    x, y = x.ravel(), y.ravel()
+
+    mask = chip_mask(x, y, width, height, radius, flat_y, edge_exclusion)
+    if bounding_box is not None:
+        (ll_x, ll_y), (ur_x, ur_y) = bounding_box
+        mask &= (ll_x <= x) & (x <= ur_x) & (ll_y <= y) & (y <= ur_y)
+    if exclusion_zones:
+        zones = np.asarray(exclusion_zones, dtype=float).reshape(-1, 4)  # ll_x, ll_y, ur_x, ur_y
+        center_x, center_y = (zones[:, 0] + zones[:, 2])/2, (zones[:, 1] + zones[:, 3])/2
+        overlap = (np.abs(x[:, None] - center_x) < (width + zones[:, 2] - zones[:, 0])/2) & \
+                  (np.abs(y[:, None] - center_y) < (height + zones[:, 3] - zones[:, 1])/2)
+        mask &= ~overlap.any(axis=1)
+
+    x, y = x[mask], y[mask]
+    order = np.argsort(x**2 + y**2, kind='stable')
+    return np.column_stack([x[order], y[order]])
+
+
+def grid_placement(width, height, radius, flat_y=None, edge_exclusion=0., street=0., offset_steps=16,
+                   bounding_box=None, exclusion_zones=None) -> np.ndarray:
+    """
+    Place chips of equal size on a grid with the pitch chip size + street. The grid offset is searched on
+    offset_steps x offset_steps points within one pitch, the offset with the most chips wins
+    @param width: chip width
+    @param height: chip height
+    @param radius: wafer radius
+    @param flat_y: y coordinate of the flat, None for a wafer without flat
+    @param edge_exclusion: width of the unusable ring at the wafer edge
+    @param street: width of the dicing streets between the chips
+    @param offset_steps: amount of offsets per axis for the grid search
+    @param bounding_box: constraint for the chip centers in the format [(ll_x, ll_y), (ur_x, ur_y)], None for none
+    @param exclusion_zones: list of rectangles [(ll_x, ll_y), (ur_x, ur_y)] which the chips must not overlap
+    @return: array of shape (n, 2) with the chip centers, sorted by ascending distance from the wafer center
+    """
+    pitch_x, pitch_y = width + street, height + street
+
+    best = np.empty((0, 2))
+    for offset_x in np.arange(offset_steps)*pitch_x/offset_steps:
+        for offset_y in np.arange(offset_steps)*pitch_y/offset_steps:
+            positions = grid_positions(pitch_x, pitch_y, radius, (offset_x, offset_y), width, height, flat_y,
+                                       edge_exclusion, bounding_box, exclusion_zones)
+            if len(positions) > len(best):
+                best = positions
+
+    return best
+
+
+def shelf_placement(sizes, radius, flat_y=None, edge_exclusion=0., street=0., offset_steps=16) -> list:
+    """
+    Pack chips of mixed sizes into horizontal shelves, starting at the bottom of the wafer. Chips are assigned tallest
+    first, each shelf takes the height of its tallest chip and is filled first fit from left to right within the
+    usable width at its outer edge. The shelves are centered horizontally, the vertical start of the first shelf is
+    searched on offset_steps points within the height of the tallest chip
+    @param sizes: list of (width, height) per chip
+    @param radius: wafer radius
+    @param flat_y: y coordinate of the flat, None for a wafer without flat
+    @param edge_exclusion: width of the unusable ring at the wafer edge
+    @param street: width of the dicing streets between the chips
+    @param offset_steps: amount of vertical offsets to try
+    @return: list with the chip center (x, y) per chip, None for chips which do not fit
+    """
+    usable = radius - edge_exclusion
+    bottom = flat_y + edge_exclusion if flat_y is not None else -usable
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])  # tallest first, stable
+
+    best = [None]*len(sizes)
+    if not sizes:
+        return best
+
+    for offset in np.arange(offset_steps)*max(h for _, h in sizes)/offset_steps:
+        positions = [None]*len(sizes)
+        remaining = list(order)
+        y = bottom + offset
+
+        while remaining:
+            shelf_height = sizes[remaining[0]][1]
+            if y + shelf_height > usable:
+                break
+            # the shelf edge farther from the wafer center limits the usable width
+            y_far = max(abs(y), abs(y + shelf_height))
+            half_width = np.sqrt(max(usable**2 - y_far**2, 0))
+
+            placed = []
+            x = -half_width
+            for i in remaining:
+                width = sizes[i][0]
+                if x + width <= half_width:
+                    placed.append((i, x + width/2))
+                    x += width + street
+
+            shift = (half_width - (x - street))/2 if placed else 0  # center the shelf
+            for i, x_center in placed:
+                positions[i] = (float(x_center + shift), float(y + sizes[i][1]/2))
+                remaining.remove(i)
+
+            y += shelf_height + street
+
+        if sum(p is not None for p in positions) > sum(p is not None for p in best):
+            best = positions
+
+    return best
@@ -6,6 +6,23 @@ import numpy as np
 import scipy.integrate as integrate
 from scipy.optimize import root
 from scipy.constants import epsilon_0, mu_0
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def tanh_sinh_nodes(step=1/32., t_max=3.2):
+    """
+    Nodes and weights of the tanh-sinh (double exponential) rule on [0, 1]. The rule handles the integrable endpoint
+    singularities at the branch points, all nodes are strictly inside the interval.
+    Returns the nodes u, their distances to the upper end 1-u (kept separately for precision) and the weights
+    """
+    t = np.arange(-t_max, t_max + step/2, step)
+    u = 1/(1+np.exp(-np.pi*np.sinh(t)))
+    u_upper = 1/(1+np.exp(np.pi*np.sinh(t)))
+    weights = step*np.pi*np.cosh(t)*u*u_upper
+    keep = (u > 0) & (u_upper > 0)
+    return u[keep], u_upper[keep], weights[keep]
+
 
 class coplanar_coupler:
     def __init__(self, s1=None,s2=None,w1=None,w2=None,w3=None,epsilon_eff=None):
@@ -16,6 +33,7 @@ class coplanar_coupler:
         self.w3 = w3
         self.epsilon_eff = epsilon_eff
         self.port = 'notch'
+        self.quadrature = 'tanh-sinh'  # 'tanh-sinh' for the vectorized fixed rule, 'quad' for adaptive scipy quadrature
     
     def z_branch_points_cpw(self, s1=None, s2=None, w1=None, w2=None, w3=None):
         if self.port == 'notch':
@@ -39,7 +57,7 @@ class coplanar_coupler:
         z_G = z_F+s1
         z_H = z_G+w1
         z_I = z_H+s1    
-        return [np.complex(x) for x in [z_B, z_C, z_D, z_E, z_F, z_G, z_H, z_I]]
+        return [complex(x) for x in [z_B, z_C, z_D, z_E, z_F, z_G, z_H, z_I]]
 
     def z_branch_points_butt(self, s1=None, s2=None, w1=None, w2=None, w3=None):
         if not s1: s1 = self.s1
@@ -56,7 +74,7 @@ class coplanar_coupler:
         z_H = w1/2.
         z_I = w1/2.+s1
         
-        return [np.complex(x) for x in [z_B, z_C, z_D, z_E, z_F, z_G, z_H, z_I]]
+        return [complex(x) for x in [z_B, z_C, z_D, z_E, z_F, z_G, z_H, z_I]]
     
     def conformal_transform_difference_by_parts(self,z0,z1,branch_point1,branch_point2,branch_points,zero_points):
         # 1) solving integral part (positive)
@@ -65,23 +83,43 @@ class coplanar_coupler:
                            np.prod([z-zero_point for zero_point in zero_points]) / \
                            np.prod([np.sqrt(z-branch_point) for branch_point_id, branch_point \
                            in enumerate(branch_points) if branch_point_id not in [branch_point1, branch_point2]])
-        f2 = lambda z: np.log(z-(branch_points[branch_point1] + branch_points[branch_point2])/2 + \
-                           np.sqrt((z-branch_points[branch_point1])*(z-branch_points[branch_point2]))) * \
-                           np.sum([np.prod([(z-zero_point) for zero_point_id, zero_point in enumerate(zero_points) \
-                           if zero_point_id != diff_zero_point_id])/ \
-                           np.prod([np.sqrt(z-branch_point) for branch_point_id, branch_point \
-                           in enumerate(branch_points) if branch_point_id not in [branch_point1, branch_point2]]) \
-                           for diff_zero_point_id, diff_zero_point in enumerate(zero_points)]+ \
-                           [np.prod([z-zero_point for zero_point in zero_points]) / \
-                           np.prod([np.sqrt(z-branch_point) for branch_point_id, branch_point \
-                           in enumerate(branch_points) if branch_point_id not in [branch_point1, branch_point2]]) / \
-                           (z-diff_branch_point)*(-0.5) for diff_branch_point_id, diff_branch_point in enumerate(branch_points) \
-                           if diff_branch_point_id not in [branch_point1, branch_point2] ])
+        f2 = lambda z: self.conformal_transform_integrand(z,branch_point1,branch_point2,branch_points,zero_points)
 
         integral_part = f1(z1)-f1(z0)
-        numerical_part = np.complex(*tuple(integrate.quad(lambda t: f2(t*(z1-z0)+z0).real, 0, 1)))+1j*np.complex(*tuple(integrate.quad(lambda t: f2(t*(z1-z0)+z0).imag, 0, 1)))
+        if self.quadrature == 'quad':
+            numerical_part = complex(*tuple(integrate.quad(lambda t: f2(np.asarray([t*(z1-z0)+z0]))[0].real, 0, 1)))+ \
+                             1j*complex(*tuple(integrate.quad(lambda t: f2(np.asarray([t*(z1-z0)+z0]))[0].imag, 0, 1)))
+        elif self.quadrature == 'tanh-sinh':
+            # real and imaginary part from one evaluation over all nodes, nodes close to z1 are measured from z1
+            u, u_upper, weights = tanh_sinh_nodes()
+            z = np.where(u < 0.5, z0+u*(z1-z0), z1-u_upper*(z1-z0))
+            numerical_part = np.sum(weights*f2(z))
+        else:
+            raise ValueError(f"Unknown quadrature {self.quadrature}, use 'tanh-sinh' or 'quad'")
 
-        return integral_part - (z1-z0)*numerical_part   
+        return integral_part - (z1-z0)*numerical_part
+
+    def conformal_transform_integrand(self,z,branch_point1,branch_point2,branch_points,zero_points):
+        # 2) remaining integrand after integration by parts, evaluated for an array of points z at once
+        z = np.asarray(z, dtype=complex)[:, None]
+        other_branch_points = np.asarray([branch_point for branch_point_id, branch_point in enumerate(branch_points) \
+                                          if branch_point_id not in [branch_point1, branch_point2]], dtype=complex)
+        zero_points = np.asarray(zero_points, dtype=complex)
+
+        log_part = np.log(z[:, 0]-(branch_points[branch_point1] + branch_points[branch_point2])/2 + \
+                          np.sqrt((z[:, 0]-branch_points[branch_point1])*(z[:, 0]-branch_points[branch_point2])))
+        z_branch = z-other_branch_points
+        z_zero = z-zero_points
+        sqrt_product = np.prod(np.sqrt(z_branch), axis=1)
+
+        # derivative of the zero point product, leaving out one factor at a time
+        zero_derivative = np.zeros(len(z), dtype=complex)
+        for diff_zero_point_id in range(len(zero_points)):
+            zero_derivative += np.prod(np.delete(z_zero, diff_zero_point_id, axis=1), axis=1)
+        # derivative of the inverse branch point product
+        branch_derivative = np.prod(z_zero, axis=1)*(-0.5)*np.sum(1/z_branch, axis=1)
+
+        return log_part*(zero_derivative+branch_derivative)/sqrt_product
 
     def w_special_points(self, z_branch_points, z_zero_points):
         w_branch_points = []
@@ -111,15 +149,17 @@ class coplanar_coupler:
         #z_B,z_C,z_D,z_E,z_F,z_G,z_H,z_I = z_branch_points           
         def constraint(t_zero_points):
             z_zero_points = [t if point_type=='real' else 1j*t for t,point_type in zip(t_zero_points, z_zero_point_types)]
-            constraint_values = [ self.conformal_transform_difference_by_parts(\
-                                    z_branch_points[constraint_point_pair[0]], z_branch_points[constraint_point_pair[1]],\
-                                    constraint_point_pair[0], constraint_point_pair[1],\
-                                    z_branch_points,z_zero_points).real if constraint_types[constraint_id] == 'real' else \
-                                  self.conformal_transform_difference_by_parts(\
+            # the complex difference is computed once per point pair and shared by its real and imaginary constraint
+            differences = {}
+            for constraint_point_pair in constraint_point_ids:
+                if tuple(constraint_point_pair) not in differences:
+                    differences[tuple(constraint_point_pair)] = self.conformal_transform_difference_by_parts(\
                                     z_branch_points[constraint_point_pair[0]], z_branch_points[constraint_point_pair[1]],\
                                     constraint_point_pair[0], constraint_point_pair[1],\
-                                    z_branch_points,z_zero_points).imag
-                                      for constraint_id, constraint_point_pair in enumerate(constraint_point_ids)]
+                                    z_branch_points,z_zero_points)
+            constraint_values = [differences[tuple(constraint_point_pair)].real if constraint_types[constraint_id] == 'real' else \
+                                 differences[tuple(constraint_point_pair)].imag
+                                 for constraint_id, constraint_point_pair in enumerate(constraint_point_ids)]
             return constraint_values
         
         self.zero_points = root(constraint, z_zero_points_initial).x
@@ -10,49 +10,54 @@ class HoleGenerator:
         self.top = None
         self.dbu = None
 
-    def create_hole_mask(self, file_out, width=10000, height=6000, l_spacing=50, l_sigma=3, l_size=2, hd_spacing=10, hd_sigma=2, hd_size=2):
+    def create_hole_mask(self, file_out, width=10000, height=6000, l_spacing=50, l_sigma=3, l_size=2, hd_spacing=10, hd_sigma=2, hd_size=2, seed=-1, directory="../../chips/"):
         """
         Creates a hole mask saves it automatically as a .gds file.
         :@param file_out: Name of the gds file
+        :@param seed: Seed for the random hole offsets, -1 for a random seed
+        :@param directory: Directory of the gds file
         """
 
         self.lay = pya.Layout()
         self.top = self.lay.create_cell("HOLE")
         self.dbu = self.lay.dbu
 
-        self._write_holes(width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size)
-        self._write_file(file_out)
+        self._write_holes(width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size, seed)
+        self._write_file(file_out, directory)
 
-    def _write_holes(self, width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size):
+    def _write_holes(self, width, height, l_spacing, l_sigma, l_size, hd_spacing, hd_sigma, hd_size, seed=-1):
         """
         Subroutine for writing the main structures.
         """
 
         # periodic holes
         print("writing low density holes...")
-        hole_pattern = HoleMask(width=width, height=height, spacing=l_spacing, sigma=l_sigma, size=l_size, hd_holes=0)
+        hole_pattern = HoleMask(width=width, height=height, spacing=l_spacing, sigma=l_sigma, size=l_size, hd_holes=0,
+                                seed=seed)
         hole_cell = self.lay.create_cell(hole_pattern.cell_name(), lib_name, hole_pattern.as_list())
         trans = pya.DCplxTrans.new(1, 0, False, 0, 0)
         self.top.insert(pya.DCellInstArray(hole_cell.cell_index(), trans))
 
         # high density holes
         print("writing high density holes...")
-        hole_pattern = HoleMask(width=width, height=height, spacing=hd_spacing, sigma=hd_sigma, size=hd_size, hd_holes=1)
+        hole_pattern = HoleMask(width=width, height=height, spacing=hd_spacing, sigma=hd_sigma, size=hd_size, hd_holes=1,
+                                seed=seed+1 if seed >= 0 else -1)
         hole_cell = self.lay.create_cell(hole_pattern.cell_name(), lib_name, hole_pattern.as_list())
         trans = pya.DCplxTrans.new(1, 0, False, 0, 0)
         self.top.insert(pya.DCellInstArray(hole_cell.cell_index(), trans))
 
         self.top.flatten(1)
 
-    def _write_file(self, file_out):
+    def _write_file(self, file_out, directory="../../chips/"):
         """
         Subroutine for saving the file.
         :@param file_out: Name of the .gds file
+        :@param directory: Directory of the .gds file
         """
 
         print("Saving file...")
-        Path("../../chips/").mkdir(parents=True, exist_ok=True)
-        self.lay.write("../../chips/" + file_out + ".gds")
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.lay.write(str(Path(directory) / (file_out + ".gds")))
 
 # # Example usage:
 # hg = HoleGenerator()
@@ -0,0 +1,94 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import src.library.KappaStore as KappaStore
+import src.library.ResonatorUtil as Util
+
+"""
+Command line tool for precomputing kappa values of a geometry sweep, e.g. for a new substrate or CPW geometry. The
+conformal mapping solves are distributed over a process pool and every result is written to the kappa store right away,
+so an interrupted sweep resumes where it stopped.
+
+Example usage (from the repository root):
+python -m src.scripts.KappaPrecompute --width 8:12:1 --gap 4:8:1 --coupling-ground 2:10:1
+"""
+
+
+def parse_range(value: str) -> list:
+    """
+    Parse a range argument
+    @param value: either 'start:stop:step' (stop included) or a comma separated list of values
+    @return: list of values
+    """
+    if ":" in value:
+        start, stop, step = (float(v) for v in value.split(":"))
+        if step <= 0:
+            raise argparse.ArgumentTypeError(f"Step of range '{value}' has to be positive")
+        return [round(v, 6) for v in np.arange(start, stop + step/2, step).tolist()]
+    return [float(v) for v in value.split(",")]
+
+
+def sweep_keys(width, gap, coupling_ground, width_tl=None, gap_tl=None) -> list:
+    """
+    All geometry tuples of the sweep
+    @param width: resonator widths
+    @param gap: resonator gaps
+    @param coupling_ground: ground widths between TL and resonator
+    @param width_tl: TL widths, None for using the resonator width
+    @param gap_tl: TL gaps, None for using the resonator gap
+    @return: list of geometry tuples (width_cpw, gap_cpw, width_res, gap_res, coupling_ground, eps_eff). Kappa does
+             not depend on eps_eff, all keys carry the reference value of the kappa store
+    """
+    keys = []
+    for w, g, cg in itertools.product(width, gap, coupling_ground):
+        for w_tl, g_tl in itertools.product(width_tl or [w], gap_tl or [g]):
+            keys.append((float(w_tl), float(g_tl), float(w), float(g), float(cg),
+                         KappaStore.reference_eps_eff))
+    return keys
+
+
+def precompute(keys, workers=None):
+    """
+    Solve and store all kappa values of the sweep which are not in the store yet
+    @param keys: geometry tuples
+    @param workers: number of worker processes, None for the number of CPUs
+    """
+    done = KappaStore.keys()
+    missing = [key for key in dict.fromkeys(keys) if key not in done]
+    print(f"{len(keys)-len(missing)} of {len(keys)} kappa values already in the store, calculating {len(missing)}...")
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(Util.solve_kappa, *key): key for key in missing}
+        for i, future in enumerate(as_completed(futures)):
+            key = futures[future]
+            try:
+                kappa = future.result()
+            except Exception as e:
+                print(f"Failed for {key}: {e}")
+                continue
+            KappaStore.store(key, kappa)  # checkpoint
+            print(f"[{i+1}/{len(missing)}] kappa{key} = {kappa:.6f} ({time.time()-start:.1f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute kappa values for a sweep of CPW geometries")
+    parser.add_argument("--width", type=parse_range, required=True, help="resonator widths, 'start:stop:step' or list")
+    parser.add_argument("--gap", type=parse_range, required=True, help="resonator gaps, 'start:stop:step' or list")
+    parser.add_argument("--coupling-ground", type=parse_range, required=True,
+                        help="ground widths between TL and resonator, 'start:stop:step' or list")
+    parser.add_argument("--width-tl", type=parse_range, default=None, help="TL widths, default: resonator width")
+    parser.add_argument("--gap-tl", type=parse_range, default=None, help="TL gaps, default: resonator gap")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, default: CPU count")
+    args = parser.parse_args()
+
+    precompute(sweep_keys(args.width, args.gap, args.coupling_ground, args.width_tl, args.gap_tl),
+               args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+import pytest
+
+pya = pytest.importorskip("klayout.db")
+
+import src.ChipBuilder as CB
+
+"""
+Tests for the chip builder. The builder uses paths relative to src/scripts, so the tests run from there
+"""
+
+script_dir = Path(__file__).resolve().parents[1] / "src" / "scripts"
+
+
+def stage_label(cb: CB.ChipBuilder) -> str:
+    """
+    Reconstruct the chip text from the glyph instances of the text stage of an incremental build
+    @param cb: chip builder after an incremental build
+    @return: text with one line per text cell
+    """
+    lay = cb._stage_lay
+    stage = lay.cell(cb._stages["text"][0])
+
+    lines = []
+    for line_inst in sorted(stage.each_inst(), key=lambda inst: -inst.dcplx_trans.disp.y):
+        glyphs = []
+        for inst in sorted(lay.cell(line_inst.cell_index).each_inst(), key=lambda inst: inst.dcplx_trans.disp.x):
+            name = lay.cell(inst.cell_index).name[len("circular_font_"):]
+            glyphs.append(" " if name == "space" else name if len(name) == 1 else f"´{name}´")
+        lines.append("".join(glyphs))
+    return "\n".join(lines)
+
+
+def test_incremental_rebuild_updates_frequency_label(monkeypatch):
+    monkeypatch.chdir(script_dir)
+
+    cb = CB.ChipBuilder().remove_hole_mask().set_incremental()
+    cb.set_text("incremental test", write_frequencies=True)
+    cb.add_resonator(4.0)
+    cb.add_resonator(4.2)
+
+    path = cb.build_chip("test_incremental_label")
+    try:
+        assert stage_label(cb) == cb._chip_text()
+        assert "4.20" in stage_label(cb)
+        first_key = cb._stages["text"][1]
+
+        # replace the second resonator and rebuild
+        cb.resonator_list.pop()
+        cb.add_resonator(4.4)
+        cb.build_chip("test_incremental_label")
+
+        assert "$FREQUENCIES$" in cb.text
+        assert cb._stages["text"][1] != first_key
+        assert "4.40" in stage_label(cb) and "4.20" not in stage_label(cb)
+        assert stage_label(cb) == cb._chip_text()
+    finally:
+        os.remove(path)
+
+
+@pytest.mark.parametrize("mode", ["region", "deep", "tiled", "incremental"])
+def test_boolean_mode_matches_processor(monkeypatch, mode):
+    monkeypatch.chdir(script_dir)
+
+    cb = CB.ChipBuilder().set_hole_lattice()
+    if mode == "incremental":
+        cb.set_incremental().set_boolean_mode("processor", check=True)
+    else:
+        cb.set_boolean_mode(mode, check=True)
+    cb.add_resonator(4.0)
+    cb.add_resonator(4.2)
+
+    # raises a ValueError if the result differs from the 'processor' engine
+    path = cb.build_chip(f"test_boolean_{mode}")
+    try:
+        if mode == "incremental":
+            # rebuild with only the tiles around the changed resonator recomputed
+            cb.resonator_list.pop()
+            cb.add_resonator(4.4)
+            cb.build_chip(f"test_boolean_{mode}")
+    finally:
+        os.remove(path)